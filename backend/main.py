@@ -14,6 +14,7 @@ from fastapi.responses import FileResponse
 from pathlib import Path
 
 from .database import create_db_and_tables
+from .services import garbage_collector, github_service, import_jobs, storage, upload_sessions
 from .routes import (
     auth_router,
     assignments_router,
@@ -32,9 +33,18 @@ FRONTEND_DIR = Path(__file__).parent.parent / "frontend" / "dist"
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
-    storage = Path(__file__).parent / "storage"
-    storage.mkdir(exist_ok=True)
-    yield
+    storage.STORAGE_ROOT.mkdir(parents=True, exist_ok=True)
+    await github_service.open_client()
+    await import_jobs.start()
+    await upload_sessions.start()
+    await garbage_collector.start()
+    try:
+        yield
+    finally:
+        await garbage_collector.stop()
+        await upload_sessions.stop()
+        await import_jobs.stop()
+        await github_service.close_client()
 
 
 app = FastAPI(
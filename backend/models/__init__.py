@@ -1,15 +1,21 @@
 from .user import User, UserCreate, UserRead, UserUpdate, VerificationUpdate
-from .assignment import Assignment, AssignmentCreate, AssignmentUpdate, AssignmentRead
+from .assignment import Assignment, AssignmentCreate, AssignmentUpdate, AssignmentRead, ImportManifest
 from .supplementary_material import SupplementaryMaterial, MaterialCreate, MaterialRead
 from .comment import Comment, CommentCreate, CommentRead
 from .blog_post import BlogPost, BlogPostCreate, BlogPostUpdate, BlogPostRead
 from .instruction_page import InstructionPage, InstructionPageCreate, InstructionPageUpdate, InstructionPageRead
+from .blob import Blob
+from .import_job import ImportJob, ImportJobRead
+from .upload_session import UploadSession, UploadSessionCreate, UploadSessionRead
 
 __all__ = [
     "User", "UserCreate", "UserRead", "UserUpdate", "VerificationUpdate",
-    "Assignment", "AssignmentCreate", "AssignmentUpdate", "AssignmentRead",
+    "Assignment", "AssignmentCreate", "AssignmentUpdate", "AssignmentRead", "ImportManifest",
     "SupplementaryMaterial", "MaterialCreate", "MaterialRead",
     "Comment", "CommentCreate", "CommentRead",
     "BlogPost", "BlogPostCreate", "BlogPostUpdate", "BlogPostRead",
     "InstructionPage", "InstructionPageCreate", "InstructionPageUpdate", "InstructionPageRead",
+    "Blob",
+    "ImportJob", "ImportJobRead",
+    "UploadSession", "UploadSessionCreate", "UploadSessionRead",
 ]
@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Column, JSON
 
 
@@ -15,10 +16,31 @@ class AssignmentBase(SQLModel):
 
 
 class Assignment(AssignmentBase, table=True):
+    __table_args__ = (
+        # list_assignments: live, published assignments, newest first
+        Index("ix_assignment_is_published_deleted_at_created_at", "is_published", "deleted_at", "created_at"),
+        # the same with unpublished ones, and the garbage collector's queue
+        Index("ix_assignment_deleted_at_created_at", "deleted_at", "created_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     created_by_id: Optional[int] = Field(default=None, foreign_key="user.id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    deleted_at: Optional[datetime] = None  # purged by services/garbage_collector.py
+
+
+class ImportManifest(SQLModel):
+    """
+    Which files of a repo to import; supplied with the import request or
+    as .eduimport.json at the repo root. Globs without a "/" match any
+    path segment (e.g. "node_modules", "*.mp4"); others match the whole
+    path, with "*" crossing directories (e.g. "data/*").
+    """
+    include: list[str] = []  # empty: everything not excluded
+    exclude: list[str] = []
+    max_bytes: Optional[int] = Field(default=None, ge=0)
+    max_files: Optional[int] = Field(default=None, ge=0)
 
 
 class AssignmentCreate(SQLModel):
@@ -28,6 +50,7 @@ class AssignmentCreate(SQLModel):
     tags: list[str] = []
     github_url: Optional[str] = None
     github_branch: Optional[str] = None
+    import_manifest: Optional[ImportManifest] = None
 
 
 class AssignmentUpdate(SQLModel):
@@ -0,0 +1,10 @@
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+
+class Blob(SQLModel, table=True):
+    """A content-addressed file under storage/blobs/, keyed by its git blob SHA."""
+    sha: str = Field(primary_key=True)
+    size: int = Field(default=0)
+    ref_count: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Column, JSON
 
 
@@ -13,6 +14,11 @@ class BlogPostBase(SQLModel):
 
 
 class BlogPost(BlogPostBase, table=True):
+    __table_args__ = (
+        # list_posts: published posts, newest first
+        Index("ix_blogpost_is_published_published_at", "is_published", "published_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     author_id: int = Field(foreign_key="user.id")
     published_at: Optional[datetime] = None
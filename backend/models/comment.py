@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
@@ -11,9 +12,16 @@ class CommentBase(SQLModel):
 
 
 class Comment(CommentBase, table=True):
+    __table_args__ = (
+        # list_comments: an assignment's thread in posting order
+        Index("ix_comment_assignment_id_created_at", "assignment_id", "created_at"),
+        Index("ix_comment_parent_id", "parent_id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    deleted_at: Optional[datetime] = Field(default=None, index=True)  # purged by services/garbage_collector.py
 
 
 class CommentCreate(SQLModel):
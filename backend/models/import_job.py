@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field, Column, JSON
+
+
+class ImportJob(SQLModel, table=True):
+    """A queued GitHub import or re-sync, run by services/import_jobs.py."""
+    __table_args__ = (
+        # import_jobs.active_job: an assignment's queued or running job
+        Index("ix_importjob_assignment_id_status", "assignment_id", "status"),
+        # import_jobs._claim_next: queued jobs that are due, earliest first
+        Index("ix_importjob_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(default="import")  # import, sync
+    status: str = Field(default="queued")  # queued, running, done, failed
+    assignment_id: Optional[int] = Field(default=None, foreign_key="assignment.id")
+    created_by_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    files_done: int = Field(default=0)  # downloads finished so far
+    files_total: int = Field(default=0)  # files that need downloading
+    bytes_done: int = Field(default=0)
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+
+class ImportJobRead(SQLModel):
+    id: int
+    kind: str
+    status: str
+    assignment_id: Optional[int]
+    attempts: int
+    next_attempt_at: datetime
+    files_done: int
+    files_total: int
+    bytes_done: int
+    result: Optional[dict]
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime]
@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
@@ -13,6 +14,11 @@ class InstructionPageBase(SQLModel):
 
 
 class InstructionPage(InstructionPageBase, table=True):
+    __table_args__ = (
+        # list_pages: published pages by category, in display order
+        Index("ix_instructionpage_is_published_category_display_order", "is_published", "category", "display_order"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     author_id: int = Field(foreign_key="user.id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
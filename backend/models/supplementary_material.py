@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
@@ -8,15 +9,23 @@ class SupplementaryMaterialBase(SQLModel):
     material_type: str = Field(default="article")  # article, github_repo, reference, video, document, other
     title: str
     url: Optional[str] = None
-    file_path: Optional[str] = None  # for uploaded files
+    file_path: Optional[str] = None  # for uploaded files, see services/material_service.py
     original_filename: Optional[str] = None
+    file_size: Optional[int] = None
+    content_hash: Optional[str] = None  # git blob SHA of the uploaded file (its blob store key)
     excerpt: Optional[str] = None
     display_order: int = Field(default=0)
 
 
 class SupplementaryMaterial(SupplementaryMaterialBase, table=True):
+    __table_args__ = (
+        # an assignment's materials in display order
+        Index("ix_supplementarymaterial_assignment_id_display_order", "assignment_id", "display_order"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    deleted_at: Optional[datetime] = Field(default=None, index=True)  # purged by services/garbage_collector.py
 
 
 class MaterialCreate(SQLModel):
@@ -35,6 +44,8 @@ class MaterialRead(SQLModel):
     url: Optional[str]
     file_path: Optional[str]
     original_filename: Optional[str]
+    file_size: Optional[int]
+    content_hash: Optional[str]
     excerpt: Optional[str]
     display_order: int
     created_at: datetime
@@ -0,0 +1,36 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlmodel import SQLModel, Field
+
+
+class UploadSession(SQLModel, table=True):
+    """A resumable material upload in progress (see routes/materials.py)."""
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
+    assignment_id: int = Field(foreign_key="assignment.id", index=True)
+    created_by_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    filename: str
+    size: int  # declared total size
+    received: int = Field(default=0)  # bytes stored so far; the next chunk starts here
+    title: str
+    material_type: str = Field(default="document")
+    excerpt: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+
+class UploadSessionCreate(SQLModel):
+    filename: str
+    size: int = Field(gt=0)
+    title: str
+    material_type: str = "document"
+    excerpt: Optional[str] = None
+
+
+class UploadSessionRead(SQLModel):
+    id: str
+    assignment_id: int
+    filename: str
+    size: int
+    received: int
+    expires_at: datetime
@@ -6,6 +6,8 @@ from sqlmodel import Session, select
 from ..database import get_session
 from ..auth import require_admin
 from ..models.user import User, UserRead, VerificationUpdate
+from ..models.assignment import Assignment
+from ..services import file_service, garbage_collector, material_service, serve_cache
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -41,3 +43,57 @@ def verify_user(
     session.commit()
     session.refresh(user)
     return user
+
+
+@router.get("/compression")
+def compression_report(
+    admin: User = Depends(require_admin),
+    session: Session = Depends(get_session),
+):
+    """Compression ratios of the precompressed .gz/.br copies, per imported assignment."""
+    assignments = session.exec(
+        select(Assignment).where(Assignment.deleted_at.is_(None)).order_by(Assignment.id)
+    ).all()
+    reports = []
+    for assignment in assignments:
+        report = file_service.compression_report(assignment.id)
+        if report is not None:
+            reports.append({"title": assignment.title, **report})
+    return {
+        "brotli_available": file_service.brotli is not None,
+        "bytes_saved": sum(r["bytes_saved"] for r in reports),
+        "assignments": reports,
+    }
+
+
+@router.get("/storage")
+def storage_report(
+    admin: User = Depends(require_admin),
+    session: Session = Depends(get_session),
+):
+    """Disk usage of the shared blob store and of uploaded materials, with deduplication savings."""
+    return {
+        "blobs": file_service.blob_usage(session),
+        "materials": material_service.storage_report(session),
+    }
+
+
+@router.get("/serve-cache")
+def get_serve_cache_stats(admin: User = Depends(require_admin)):
+    """Hit rate and memory use of the in-memory assignment file cache."""
+    return serve_cache.get_stats()
+
+
+@router.get("/gc")
+def get_gc_stats(admin: User = Depends(require_admin)):
+    """Rows and bytes removed by the background garbage collector, and deletions still pending."""
+    return garbage_collector.get_stats()
+
+
+@router.post("/gc")
+def run_gc(admin: User = Depends(require_admin)):
+    """Purge deleted rows and sweep storage for orphans now, instead of waiting for the next round."""
+    return {
+        "collected": garbage_collector.collect(),
+        "swept": garbage_collector.sweep_orphans(),
+    }
@@ -1,15 +1,22 @@
+import calendar
 from datetime import datetime
 from typing import Optional
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse, StreamingResponse
 from sqlmodel import Session, select
 
 from ..database import get_session
 from ..auth import require_auth, require_admin
 from ..models.user import User
 from ..models.assignment import Assignment, AssignmentCreate, AssignmentUpdate, AssignmentRead
-from ..services import github_service, file_service
+from ..models.import_job import ImportJob, ImportJobRead
+from ..models.supplementary_material import SupplementaryMaterial
+from ..services import (
+    github_service, file_service, file_responses, import_jobs, serve_cache, export_service, storage,
+    garbage_collector,
+)
 
 router = APIRouter(prefix="/assignments", tags=["assignments"])
 
@@ -23,7 +30,7 @@ def list_assignments(
     limit: int = 50,
     session: Session = Depends(get_session),
 ):
-    query = select(Assignment)
+    query = select(Assignment).where(Assignment.deleted_at.is_(None))
     if published_only:
         query = query.where(Assignment.is_published == True)
     if subject_area:
@@ -39,22 +46,28 @@ def list_assignments(
 @router.get("/{assignment_id}", response_model=AssignmentRead)
 def get_assignment(assignment_id: int, session: Session = Depends(get_session)):
     assignment = session.get(Assignment, assignment_id)
-    if not assignment:
+    if not assignment or assignment.deleted_at:
         raise HTTPException(status_code=404, detail="Assignment not found")
     return assignment
 
 
-@router.post("/import", response_model=AssignmentRead)
-async def import_from_github(
+@router.post("/import", response_model=ImportJobRead, status_code=202)
+def import_from_github(
     body: AssignmentCreate,
     user: User = Depends(require_auth),
     session: Session = Depends(get_session),
 ):
+    """
+    Queue an import and return the job; poll GET /assignments/imports/{id}.
+    The assignment stays unpublished until its files are in place. The
+    finished job's result reports files left out by the import manifest.
+    """
     if not body.github_url:
         raise HTTPException(status_code=422, detail="github_url is required")
-
-    owner, repo, branch = github_service.parse_github_url(body.github_url)
-    files, resolved_branch = await github_service.fetch_repo_files(owner, repo, branch)
+    try:
+        _, repo, branch = github_service.parse_github_url(body.github_url)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
     assignment = Assignment(
         title=body.title or repo,
@@ -62,28 +75,53 @@ async def import_from_github(
         subject_area=body.subject_area,
         tags=body.tags,
         github_url=body.github_url,
-        github_branch=resolved_branch,
+        github_branch=branch or None,
+        is_published=False,
         created_by_id=user.id,
     )
     session.add(assignment)
     session.commit()
     session.refresh(assignment)
+    serve_cache.invalidate(assignment.id)  # drop 404s cached for this id
+    if body.import_manifest:
+        file_service.write_import_manifest(assignment.id, body.import_manifest.model_dump())
 
-    # Download files to storage
-    file_paths = []
-    for f in files:
-        content = await github_service.download_file(f["download_url"])
-        file_service.save_file(assignment.id, f["path"], content)
-        file_paths.append(f["path"])
+    return import_jobs.enqueue(session, "import", assignment.id, user.id)
 
-    entry = github_service.detect_entry_file(file_paths)
-    if entry:
-        assignment.file_path = entry
-        session.add(assignment)
-        session.commit()
-        session.refresh(assignment)
 
-    return assignment
+@router.get("/imports/{job_id}", response_model=ImportJobRead)
+def get_import_job(
+    job_id: int,
+    user: User = Depends(require_auth),
+    session: Session = Depends(get_session),
+):
+    job = session.get(ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if job.created_by_id != user.id and user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only the creator or an admin can view this import")
+    return job
+
+
+@router.post("/{assignment_id}/sync", response_model=ImportJobRead, status_code=202)
+def sync_from_github(
+    assignment_id: int,
+    user: User = Depends(require_auth),
+    session: Session = Depends(get_session),
+):
+    """Queue a re-sync that downloads only files that changed upstream."""
+    assignment = session.get(Assignment, assignment_id)
+    if not assignment or assignment.deleted_at:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    if assignment.created_by_id != user.id and user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only the creator or an admin can sync this assignment")
+    if not assignment.github_url:
+        raise HTTPException(status_code=422, detail="Assignment was not imported from GitHub")
+
+    job = import_jobs.active_job(session, assignment_id)
+    if job:
+        return job
+    return import_jobs.enqueue(session, "sync", assignment_id, user.id)
 
 
 @router.patch("/{assignment_id}", response_model=AssignmentRead)
@@ -94,7 +132,7 @@ def update_assignment(
     session: Session = Depends(get_session),
 ):
     assignment = session.get(Assignment, assignment_id)
-    if not assignment:
+    if not assignment or assignment.deleted_at:
         raise HTTPException(status_code=404, detail="Assignment not found")
     if assignment.created_by_id != user.id and user.role != "admin":
         raise HTTPException(status_code=403, detail="Only the creator or an admin can edit this assignment")
@@ -107,6 +145,7 @@ def update_assignment(
     session.add(assignment)
     session.commit()
     session.refresh(assignment)
+    serve_cache.invalidate(assignment_id)
     return assignment
 
 
@@ -117,25 +156,118 @@ def delete_assignment(
     session: Session = Depends(get_session),
 ):
     assignment = session.get(Assignment, assignment_id)
-    if not assignment:
+    if not assignment or assignment.deleted_at:
         raise HTTPException(status_code=404, detail="Assignment not found")
     if assignment.created_by_id != user.id and user.role != "admin":
         raise HTTPException(status_code=403, detail="Only the creator or an admin can delete this assignment")
-    file_service.delete_assignment_files(assignment_id)
-    session.delete(assignment)
-    session.commit()
+    # Files, materials and comments are removed in the background
+    garbage_collector.mark_deleted(session, assignment)
+    serve_cache.invalidate(assignment_id)
     return {"ok": True}
 
 
-@router.get("/{assignment_id}/serve", response_class=HTMLResponse)
+@router.get("/{assignment_id}/export")
+def export_assignment(
+    assignment_id: int,
+    user: User = Depends(require_auth),
+    session: Session = Depends(get_session),
+):
+    """ZIP of the assignment's files and uploaded materials with a manifest.json, streamed as it's built."""
+    assignment = session.get(Assignment, assignment_id)
+    if not assignment or assignment.deleted_at:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    if assignment.created_by_id != user.id and user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only the creator or an admin can export this assignment")
+    materials = session.exec(
+        select(SupplementaryMaterial)
+        .where(
+            SupplementaryMaterial.assignment_id == assignment_id,
+            SupplementaryMaterial.deleted_at.is_(None),
+        )
+        .order_by(SupplementaryMaterial.display_order)
+    ).all()
+    return StreamingResponse(
+        export_service.iter_assignment_zip(assignment, materials),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{export_service.archive_name(assignment)}"',
+        },
+    )
+
+
+@router.get("/{assignment_id}/serve")
 def serve_assignment(assignment_id: int, session: Session = Depends(get_session)):
+    """Redirect to the entry file, so its relative links resolve under /files/."""
+    cache_key = serve_cache.key(assignment_id, serve_cache.ENTRY)
+    file_path = serve_cache.get(cache_key)
+    if isinstance(file_path, serve_cache.Missing):
+        raise HTTPException(status_code=404, detail=file_path.detail)
+    if file_path is None:
+        assignment = session.get(Assignment, assignment_id)
+        if not assignment or assignment.deleted_at or not assignment.file_path:
+            serve_cache.put_missing(cache_key, "Assignment not found")
+            raise HTTPException(status_code=404, detail="Assignment not found")
+        file_path = assignment.file_path
+        serve_cache.put_entry_path(cache_key, file_path)
+    return RedirectResponse(
+        f"/api/assignments/{assignment_id}/files/{quote(file_path)}",
+        status_code=307,
+    )
+
+
+@router.api_route("/{assignment_id}/files/{file_path:path}", methods=["GET", "HEAD"])
+def serve_assignment_file(
+    assignment_id: int,
+    file_path: str,
+    request: Request,
+    session: Session = Depends(get_session),
+):
+    """Any file of an imported assignment, with ETag/Last-Modified revalidation and Range support."""
+    if file_path == "" or file_path.endswith("/"):
+        file_path += "index.html"
+    # Popular files come from memory; range requests always go to the file
+    cache_key = serve_cache.key(assignment_id, file_path)
+    cached = serve_cache.get(cache_key)
+    if isinstance(cached, serve_cache.Missing):
+        raise HTTPException(status_code=404, detail=cached.detail)
+    if isinstance(cached, serve_cache.CachedFile) and "range" not in request.headers:
+        return file_responses.conditional_bytes_response(
+            request, cached.bodies, file_path, cached.etag, cached.last_modified
+        )
+
     assignment = session.get(Assignment, assignment_id)
-    if not assignment or not assignment.file_path:
+    if not assignment or assignment.deleted_at:
+        serve_cache.put_missing(cache_key, "Assignment not found")
         raise HTTPException(status_code=404, detail="Assignment not found")
+    resolved = file_service.resolve_file(assignment_id, file_path)
+    if resolved is None:
+        serve_cache.put_missing(cache_key, "File not found")
+        raise HTTPException(status_code=404, detail="File not found")
+    key, sha = resolved
 
-    file_path = file_service.get_entry_file(assignment_id, assignment.file_path)
-    if not file_path.exists():
+    # The same URL can point at different content after a sync, so browsers
+    # revalidate every time (cheap: a 304 against the blob SHA)
+    if sha:
+        etag = f'"{sha}"'
+        last_modified = calendar.timegm(assignment.updated_at.utctimetuple())
+        variants = file_service.blob_variants(sha)
+    else:
+        stat = storage.backend.stat(key)
+        if stat is None:
+            raise HTTPException(status_code=404, detail="Assignment file not found on disk")
+        etag = file_responses.object_etag(key, stat)
+        last_modified = stat.mtime
+        variants = None
+    if cached is None:
+        serve_cache.put_file(cache_key, key, etag, last_modified, variants)
+    try:
+        return file_responses.stored_file_response(
+            request,
+            key,
+            file_path,
+            etag=etag,
+            last_modified=last_modified,
+            variants=variants,
+        )
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Assignment file not found on disk")
-
-    html = file_path.read_text(encoding="utf-8")
-    return HTMLResponse(content=html)
@@ -7,6 +7,7 @@ from ..database import get_session
 from ..auth import require_auth
 from ..models.user import User
 from ..models.comment import Comment, CommentCreate, CommentRead
+from ..services import garbage_collector
 
 router = APIRouter(prefix="/assignments/{assignment_id}/comments", tags=["comments"])
 
@@ -16,7 +17,7 @@ def list_comments(assignment_id: int, session: Session = Depends(get_session)):
     query = (
         select(Comment, User.display_name)
         .join(User, Comment.user_id == User.id)
-        .where(Comment.assignment_id == assignment_id)
+        .where(Comment.assignment_id == assignment_id, Comment.deleted_at.is_(None))
         .order_by(Comment.created_at)
     )
     results = session.exec(query).all()
@@ -71,10 +72,9 @@ def delete_comment(
     session: Session = Depends(get_session),
 ):
     comment = session.get(Comment, comment_id)
-    if not comment or comment.assignment_id != assignment_id:
+    if not comment or comment.assignment_id != assignment_id or comment.deleted_at:
         raise HTTPException(status_code=404, detail="Comment not found")
     if comment.user_id != user.id and user.role != "admin":
         raise HTTPException(status_code=403, detail="Not allowed")
-    session.delete(comment)
-    session.commit()
+    garbage_collector.mark_deleted(session, comment)
     return {"ok": True}
@@ -1,10 +1,32 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import HTMLResponse
+import asyncio
+import math
+import os
+import re
 
-from ..services import github_service
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+
+from ..auth import require_admin
+from ..models.user import User
+from ..services import github_cache, github_scheduler, github_service, preview_cache
 
 router = APIRouter(prefix="/github", tags=["github"])
 
+# Public origin of the app (e.g. https://edu.example.org), for links that
+# must be absolute. Never taken from the request's Host header: previews
+# are cached and shared between viewers.
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "").rstrip("/")
+
+
+def _github_error(e: Exception) -> HTTPException:
+    if isinstance(e, github_scheduler.RateLimited):
+        return HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    return HTTPException(status_code=502, detail=f"GitHub API error: {e}")
+
 
 @router.get("/branches")
 async def list_branches(
@@ -12,25 +34,68 @@ async def list_branches(
     repo: str = Query(...),
 ):
     try:
-        branches = await github_service.list_branches(owner, repo)
-        default_branch = await github_service.get_default_branch(owner, repo)
+        branches, default_branch = await asyncio.gather(
+            github_service.list_branches(owner, repo),
+            github_service.get_default_branch(owner, repo),
+        )
         return {"branches": branches, "default_branch": default_branch}
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"GitHub API error: {e}")
+        raise _github_error(e)
 
 
 @router.get("/serve", response_class=HTMLResponse)
 async def serve_branch(
+    request: Request,
     owner: str = Query(...),
     repo: str = Query(...),
     branch: str = Query(...),
 ):
+    # Absolute when PUBLIC_BASE_URL is set, so a <base href> in the document
+    # can't redirect it; root-relative otherwise
+    stylesheet_proxy = PUBLIC_BASE_URL + request.url_for("serve_stylesheet").path
     try:
-        html = await github_service.fetch_and_rewrite_html(owner, repo, branch)
-        if not html:
-            raise HTTPException(status_code=404, detail="No HTML file found in branch")
-        return HTMLResponse(content=html)
-    except HTTPException:
-        raise
+        stream = await github_service.stream_rewritten_html(
+            owner, repo, branch, stylesheet_proxy=stylesheet_proxy
+        )
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"GitHub API error: {e}")
+        raise _github_error(e)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="No HTML file found in branch")
+    return StreamingResponse(stream, media_type="text/html; charset=utf-8")
+
+
+@router.get("/stylesheet")
+async def serve_stylesheet(
+    owner: str = Query(...),
+    repo: str = Query(...),
+    ref: str = Query(...),
+    path: str = Query(...),
+):
+    """Linked CSS for branch previews, with relative url() references rewritten."""
+    if not path.endswith(".css"):
+        raise HTTPException(status_code=422, detail="Only stylesheets can be proxied")
+    try:
+        css = await github_service.fetch_rewritten_css(owner, repo, ref, path)
+    except Exception as e:
+        raise _github_error(e)
+    # Previews link stylesheets by commit SHA, whose content never changes
+    pinned = re.fullmatch(r"[0-9a-f]{40}", ref) is not None
+    return Response(
+        content=css,
+        media_type="text/css",
+        headers={"Cache-Control": "public, max-age=31536000, immutable" if pinned else "no-cache"},
+    )
+
+
+@router.get("/cache-stats")
+def cache_stats(admin: User = Depends(require_admin)):
+    return {
+        "metadata": github_cache.get_stats(),
+        "previews": preview_cache.get_stats(),
+    }
+
+
+@router.get("/rate-limit")
+def rate_limit(admin: User = Depends(require_admin)):
+    """Remaining API budget per configured token (tokens are shown by their last 4 characters)."""
+    return github_scheduler.get_stats()
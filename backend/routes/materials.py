@@ -1,26 +1,60 @@
-import shutil
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlmodel import Session, select
+from starlette.requests import ClientDisconnect
 
 from ..database import get_session
 from ..auth import require_auth
 from ..models.user import User
 from ..models.assignment import Assignment
 from ..models.supplementary_material import SupplementaryMaterial, MaterialCreate, MaterialRead
+from ..models.upload_session import UploadSession, UploadSessionCreate, UploadSessionRead
+from ..services import file_responses, file_service, garbage_collector, material_service, upload_sessions
+from ..services.material_service import MAX_FILE_SIZE
 
 router = APIRouter(prefix="/assignments/{assignment_id}/materials", tags=["materials"])
 
-MATERIALS_DIR = Path(__file__).resolve().parent.parent / "storage" / "materials"
 ALLOWED_EXTENSIONS = {
     ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
     ".csv", ".txt", ".md", ".png", ".jpg", ".jpeg", ".gif", ".svg",
-    ".zip", ".html", ".json",
+    ".zip", ".html", ".json", ".mp4", ".webm", ".mp3",
+}
+# Shown in the browser rather than downloaded. Never HTML or SVG: they
+# could run script on our origin.
+INLINE_TYPES = (
+    "application/pdf", "image/png", "image/jpeg", "image/gif",
+    "video/", "audio/", "text/plain", "text/csv", "text/markdown",
+)
+# Cache-Control by media type (first matching prefix wins). Uploads have a
+# strong ETag, so everything else revalidates; media gets a minute without
+# round trips for seeking and re-renders. The URL carries the material id,
+# not the content hash, and a purged material's id can be reused, so
+# anything longer could keep serving another file's bytes.
+CACHE_CONTROL = (
+    ("video/", "public, max-age=60"),
+    ("audio/", "public, max-age=60"),
+    ("image/", "public, max-age=60"),
+)
+DEFAULT_CACHE_CONTROL = "no-cache"
+# POST /upload reads its multipart body itself (see stage_form_upload); documented here
+UPLOAD_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file", "title"],
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "title": {"type": "string"},
+                "material_type": {"type": "string", "default": "document"},
+                "excerpt": {"type": "string"},
+            },
+        }}},
+    },
 }
-MAX_FILE_SIZE = 20 * 1024 * 1024  # 20 MB
 
 
 def _check_owner_or_admin(assignment: Assignment, user: User):
@@ -29,11 +63,67 @@ def _check_owner_or_admin(assignment: Assignment, user: User):
         raise HTTPException(status_code=403, detail="Only the assignment owner or an admin can manage materials")
 
 
+def _check_extension(filename: str) -> None:
+    suffix = Path(filename).suffix.lower()
+    if suffix not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=422, detail=f"File type '{suffix}' is not allowed")
+
+
+async def _save_uploaded_material(
+    session: Session,
+    assignment_id: int,
+    staged: material_service.StagedUpload,
+    filename: str,
+    title: str,
+    material_type: str,
+    excerpt: Optional[str],
+    upload: Optional[UploadSession] = None,
+) -> SupplementaryMaterial:
+    """
+    Create the material for a staged upload: move the file into the blob
+    store, then commit the row together with its blob reference (and
+    anything else pending in `session`). For a resumable `upload` the
+    staged file is its part file: if this fails it is kept, so completing
+    can be retried, or the upload starts over if the file already moved.
+    """
+    material = SupplementaryMaterial(
+        assignment_id=assignment_id,
+        material_type=material_type,
+        title=title,
+        excerpt=excerpt,
+        file_path=material_service.blob_file_path(staged.sha),
+        original_filename=filename,
+        file_size=staged.size,
+        content_hash=staged.sha,
+    )
+    try:
+        await material_service.store_upload(staged)
+        session.add(material)
+        file_service.add_blob_refs(session, {staged.sha: staged.size})
+    except BaseException:
+        # A blob stored for nothing is left to the orphan sweep; another
+        # upload of the same content may already point at it
+        session.rollback()
+        if upload is None:
+            material_service.discard(staged.path)
+        elif not staged.path.exists():
+            # Already moved into the store: the client has to send the file again
+            upload.received = 0
+            session.add(upload)
+            session.commit()
+        raise
+    session.refresh(material)
+    return material
+
+
 @router.get("/", response_model=list[MaterialRead])
 def list_materials(assignment_id: int, session: Session = Depends(get_session)):
     query = (
         select(SupplementaryMaterial)
-        .where(SupplementaryMaterial.assignment_id == assignment_id)
+        .where(
+            SupplementaryMaterial.assignment_id == assignment_id,
+            SupplementaryMaterial.deleted_at.is_(None),
+        )
         .order_by(SupplementaryMaterial.display_order)
     )
     return session.exec(query).all()
@@ -47,7 +137,7 @@ def add_material(
     session: Session = Depends(get_session),
 ):
     assignment = session.get(Assignment, assignment_id)
-    if not assignment:
+    if not assignment or assignment.deleted_at:
         raise HTTPException(status_code=404, detail="Assignment not found")
     _check_owner_or_admin(assignment, user)
 
@@ -61,77 +151,218 @@ def add_material(
     return material
 
 
-@router.post("/upload", response_model=MaterialRead)
+@router.post("/upload", response_model=MaterialRead, openapi_extra=UPLOAD_FORM)
 async def upload_material(
     assignment_id: int,
-    file: UploadFile = File(...),
-    title: str = Form(...),
-    material_type: str = Form("document"),
-    excerpt: Optional[str] = Form(None),
+    request: Request,
     user: User = Depends(require_auth),
     session: Session = Depends(get_session),
 ):
     assignment = session.get(Assignment, assignment_id)
-    if not assignment:
+    if not assignment or assignment.deleted_at:
         raise HTTPException(status_code=404, detail="Assignment not found")
     _check_owner_or_admin(assignment, user)
 
-    # Validate extension
-    suffix = Path(file.filename).suffix.lower()
-    if suffix not in ALLOWED_EXTENSIONS:
-        raise HTTPException(status_code=422, detail=f"File type '{suffix}' is not allowed")
+    # Parse the form as it arrives, stopping as soon as the file is too large
+    try:
+        fields, filename, staged = await material_service.stage_form_upload(request, "file", MAX_FILE_SIZE)
+    except material_service.UploadTooLarge as e:
+        # Closing the connection stops the client sending the rest of the body
+        raise HTTPException(status_code=413, detail=str(e), headers={"Connection": "close"})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        if staged is None or not fields.get("title"):
+            raise HTTPException(status_code=422, detail="A file and a title are required")
+        filename = material_service.safe_filename(filename)
+        _check_extension(filename)
+    except HTTPException:
+        if staged is not None:
+            material_service.discard(staged.path)
+        raise
+    return await _save_uploaded_material(
+        session, assignment_id, staged, filename,
+        fields["title"], fields.get("material_type") or "document", fields.get("excerpt"),
+    )
 
-    # Read content and check size
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=422, detail="File exceeds 20 MB limit")
 
-    # Save to disk
-    dest_dir = MATERIALS_DIR / str(assignment_id)
-    dest_dir.mkdir(parents=True, exist_ok=True)
+# ── Resumable uploads ────────────────────────────────────────────────────────
+# POST /uploads declares the file, PUT /uploads/{id}?offset=N appends a
+# chunk (raw request body) at the committed offset, GET /uploads/{id}
+# reports that offset after a dropped connection, and POST
+# /uploads/{id}/complete turns the finished upload into a material.
 
-    # Use a unique filename to avoid collisions
-    material = SupplementaryMaterial(
+
+def _get_upload(session: Session, assignment_id: int, upload_id: str, user: User) -> UploadSession:
+    upload = session.get(UploadSession, upload_id)
+    if not upload or upload.assignment_id != assignment_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.created_by_id != user.id and user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only the uploader or an admin can use this upload")
+    if upload.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=404, detail="Upload expired")
+    return upload
+
+
+async def _request_body(request: Request):
+    try:
+        async for chunk in request.stream():
+            yield chunk
+    except ClientDisconnect:
+        pass  # keep what arrived; the client resumes from the new offset
+
+
+@router.post("/uploads", response_model=UploadSessionRead, status_code=201)
+def create_upload(
+    assignment_id: int,
+    body: UploadSessionCreate,
+    user: User = Depends(require_auth),
+    session: Session = Depends(get_session),
+):
+    assignment = session.get(Assignment, assignment_id)
+    if not assignment or assignment.deleted_at:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    _check_owner_or_admin(assignment, user)
+
+    filename = material_service.safe_filename(body.filename)
+    _check_extension(filename)
+    if body.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=422, detail=str(material_service.UploadTooLarge(MAX_FILE_SIZE)))
+
+    upload = UploadSession(
         assignment_id=assignment_id,
-        material_type=material_type,
-        title=title,
-        excerpt=excerpt,
-        original_filename=file.filename,
+        created_by_id=user.id,
+        filename=filename,
+        size=body.size,
+        title=body.title,
+        material_type=body.material_type,
+        excerpt=body.excerpt,
+        expires_at=upload_sessions.expiry(),
     )
-    session.add(material)
+    session.add(upload)
     session.commit()
-    session.refresh(material)
+    session.refresh(upload)
+    return upload
 
-    safe_name = f"{material.id}_{file.filename}"
-    dest_path = dest_dir / safe_name
-    dest_path.write_bytes(content)
 
-    material.file_path = f"{assignment_id}/{safe_name}"
-    session.add(material)
-    session.commit()
-    session.refresh(material)
+@router.get("/uploads/{upload_id}", response_model=UploadSessionRead)
+def get_upload(
+    assignment_id: int,
+    upload_id: str,
+    user: User = Depends(require_auth),
+    session: Session = Depends(get_session),
+):
+    return _get_upload(session, assignment_id, upload_id, user)
+
+
+@router.put("/uploads/{upload_id}", response_model=UploadSessionRead)
+async def upload_chunk(
+    assignment_id: int,
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    user: User = Depends(require_auth),
+    session: Session = Depends(get_session),
+):
+    upload = _get_upload(session, assignment_id, upload_id, user)
+    lock = upload_sessions.lock(upload_id)
+    if lock.locked():
+        raise HTTPException(status_code=409, detail="Another chunk of this upload is in progress")
+    async with lock:
+        session.refresh(upload)
+        if offset != upload.received:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload is at offset {upload.received}, not {offset}",
+                headers={"Upload-Offset": str(upload.received)},
+            )
+        try:
+            written = await upload_sessions.write_chunk(upload, _request_body(request))
+        except upload_sessions.ChunkTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        upload.received += written
+        upload.expires_at = upload_sessions.expiry()
+        session.add(upload)
+        session.commit()
+        session.refresh(upload)
+    return upload
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=MaterialRead)
+async def complete_upload(
+    assignment_id: int,
+    upload_id: str,
+    user: User = Depends(require_auth),
+    session: Session = Depends(get_session),
+):
+    upload = _get_upload(session, assignment_id, upload_id, user)
+    async with upload_sessions.lock(upload_id):
+        session.refresh(upload)
+        if upload.received != upload.size:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload is incomplete: {upload.received} of {upload.size} bytes",
+                headers={"Upload-Offset": str(upload.received)},
+            )
+        staged = await upload_sessions.stage(upload)
+        session.delete(upload)
+        material = await _save_uploaded_material(
+            session, assignment_id, staged,
+            upload.filename, upload.title, upload.material_type, upload.excerpt, upload,
+        )
+    upload_sessions.discard(upload_id)
     return material
 
 
-@router.get("/{material_id}/download")
+@router.delete("/uploads/{upload_id}")
+def cancel_upload(
+    assignment_id: int,
+    upload_id: str,
+    user: User = Depends(require_auth),
+    session: Session = Depends(get_session),
+):
+    upload = _get_upload(session, assignment_id, upload_id, user)
+    if upload_sessions.lock(upload_id).locked():
+        raise HTTPException(status_code=409, detail="A chunk of this upload is in progress")
+    session.delete(upload)
+    session.commit()
+    upload_sessions.discard(upload_id)
+    return {"ok": True}
+
+
+@router.api_route("/{material_id}/download", methods=["GET", "HEAD"])
 def download_material(
     assignment_id: int,
     material_id: int,
+    request: Request,
     session: Session = Depends(get_session),
 ):
+    """An uploaded material, with ETag/Last-Modified revalidation and Range support (for seeking video) or a presigned redirect."""
     material = session.get(SupplementaryMaterial, material_id)
-    if not material or material.assignment_id != assignment_id or not material.file_path:
+    if not material or material.assignment_id != assignment_id or material.deleted_at or not material.file_path:
         raise HTTPException(status_code=404, detail="Material not found")
 
-    file_path = MATERIALS_DIR / material.file_path
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found on disk")
-
-    return FileResponse(
-        path=file_path,
-        filename=material.original_filename or file_path.name,
-        media_type="application/octet-stream",
+    key = material_service.material_key(material.file_path)
+    name = material.original_filename or key.rsplit("/", 1)[-1]
+    media_type = file_responses.guess_media_type(name)
+    cache_control = next(
+        (policy for prefix, policy in CACHE_CONTROL if media_type.startswith(prefix)),
+        DEFAULT_CACHE_CONTROL,
     )
+    blob_backed = material.file_path.startswith(material_service.BLOB_PREFIX)
+    try:
+        return file_responses.stored_file_response(
+            request,
+            key,
+            name,
+            etag=f'"{material.content_hash}"' if blob_backed else None,
+            cache_control=cache_control,
+            headers={"X-Content-Type-Options": "nosniff"},
+            download_name=name,
+            inline=media_type.startswith(INLINE_TYPES),
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found on disk")
 
 
 @router.delete("/{material_id}")
@@ -142,20 +373,14 @@ def delete_material(
     session: Session = Depends(get_session),
 ):
     assignment = session.get(Assignment, assignment_id)
-    if not assignment:
+    if not assignment or assignment.deleted_at:
         raise HTTPException(status_code=404, detail="Assignment not found")
     _check_owner_or_admin(assignment, user)
 
     material = session.get(SupplementaryMaterial, material_id)
-    if not material or material.assignment_id != assignment_id:
+    if not material or material.assignment_id != assignment_id or material.deleted_at:
         raise HTTPException(status_code=404, detail="Material not found")
 
-    # Remove file from disk if it's an upload
-    if material.file_path:
-        file_path = MATERIALS_DIR / material.file_path
-        if file_path.exists():
-            file_path.unlink()
-
-    session.delete(material)
-    session.commit()
+    # The file reference is released in the background
+    garbage_collector.mark_deleted(session, material)
     return {"ok": True}
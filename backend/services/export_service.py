@@ -0,0 +1,131 @@
+"""
+ZIP export of an assignment: its imported files, its uploaded materials
+and a manifest.json describing both (link-only materials included).
+
+The archive is produced as a stream for StreamingResponse: zipfile
+writes into a sink with no seek(), so every entry carries a data
+descriptor instead of being patched afterwards, and the sink is drained
+after each chunk. Memory stays at about one chunk (plus a deflate
+window) whatever the archive size, and nothing is written to disk.
+Formats that are already compressed are STORED, the rest DEFLATED.
+"""
+import json
+import re
+import time
+import unicodedata
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional
+
+from ..models.assignment import Assignment
+from ..models.supplementary_material import SupplementaryMaterial
+from . import file_service, material_service, storage
+
+CHUNK_SIZE = 64 * 1024
+STORED_SUFFIXES = {
+    ".pdf", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".br",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".epub",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif",
+    ".mp4", ".webm", ".mov", ".mp3", ".ogg", ".m4a",
+    ".woff", ".woff2",
+}
+
+
+class _Sink:
+    """Write-only, unseekable file object that collects what zipfile writes."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def archive_name(assignment: Assignment) -> str:
+    title = unicodedata.normalize("NFKD", assignment.title).encode("ascii", "ignore").decode()
+    slug = re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")
+    return f"{slug or 'assignment'}-{assignment.id}.zip"
+
+
+def _assignment_files(assignment_id: int) -> list[tuple[str, str, Optional[str]]]:
+    """(path in the assignment, storage key, blob sha) of every imported file."""
+    manifest = file_service.read_manifest(assignment_id)
+    if manifest is not None:
+        return [(path, file_service.blob_key(sha), sha) for path, sha in sorted(manifest.items())]
+    prefix = file_service.original_prefix(assignment_id)
+    return [(path, prefix + path, None) for path, _ in file_service.list_original_files(assignment_id)]
+
+
+def iter_assignment_zip(
+    assignment: Assignment, materials: list[SupplementaryMaterial]
+) -> Iterator[bytes]:
+    """Yield the export archive in pieces (blocking I/O: iterate it in a thread)."""
+    entries = []  # (name in the archive, storage key, stat)
+    files = []
+    for path, key, sha in _assignment_files(assignment.id):
+        stat = storage.backend.stat(key)
+        if stat is not None:
+            name = f"files/{path}"
+            entries.append((name, key, stat))
+            files.append({"path": path, "archive_path": name, "size": stat.size, "sha": sha})
+
+    material_list = []
+    for material in materials:
+        item = {
+            "id": material.id,
+            "title": material.title,
+            "material_type": material.material_type,
+            "url": material.url,
+            "excerpt": material.excerpt,
+        }
+        if material.file_path:
+            key = material_service.material_key(material.file_path)
+            stat = storage.backend.stat(key)
+            if stat is not None:
+                filename = material.original_filename or key.rsplit("/", 1)[-1]
+                name = f"materials/{material.id}_{filename}"
+                entries.append((name, key, stat))
+                item.update(archive_path=name, size=stat.size, content_hash=material.content_hash)
+        material_list.append(item)
+
+    manifest = {
+        "assignment": {
+            "id": assignment.id,
+            "title": assignment.title,
+            "description": assignment.description,
+            "github_url": assignment.github_url,
+            "github_branch": assignment.github_branch,
+            "entry_file": assignment.file_path,
+        },
+        "exported_at": datetime.utcnow().isoformat() + "Z",
+        "files": files,
+        "materials": material_list,
+    }
+
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w") as archive:
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2), zipfile.ZIP_DEFLATED)
+        for name, key, stat in entries:
+            info = zipfile.ZipInfo(name, date_time=time.localtime(stat.mtime)[:6])
+            info.file_size = stat.size
+            if Path(name).suffix.lower() in STORED_SUFFIXES:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            zip64 = info.file_size > zipfile.ZIP64_LIMIT
+            with storage.backend.open(key) as source, archive.open(info, "w", force_zip64=zip64) as out:
+                while chunk := source.read(CHUNK_SIZE):
+                    out.write(chunk)
+                    if data := sink.drain():
+                        yield data
+    yield sink.drain()  # the rest of the last entry and the central directory
@@ -0,0 +1,265 @@
+"""
+File responses with HTTP caching, shared by the asset and download routes.
+
+conditional_file_response() picks a precompressed variant the client
+accepts, answers If-None-Match / If-Modified-Since with 304 and
+otherwise returns a Starlette FileResponse, which handles Range /
+If-Range and uses the server's zero-copy pathsend extension when the
+server offers it. stored_file_response() does the same for an object in
+storage.backend, redirecting to a presigned URL when the object is
+remote and that is enabled.
+"""
+import hashlib
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+
+from . import storage
+
+# Types the platform's mimetypes table may lack or get wrong
+_MEDIA_TYPES = {
+    ".html": "text/html",
+    ".htm": "text/html",
+    ".css": "text/css",
+    ".js": "text/javascript",
+    ".mjs": "text/javascript",
+    ".json": "application/json",
+    ".map": "application/json",
+    ".svg": "image/svg+xml",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".ico": "image/x-icon",
+    ".wasm": "application/wasm",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    ".md": "text/markdown",
+    ".csv": "text/csv",
+    ".txt": "text/plain",
+    ".mp4": "video/mp4",
+    ".webm": "video/webm",
+    ".mp3": "audio/mpeg",
+}
+
+
+def guess_media_type(name: str) -> str:
+    suffix = Path(name).suffix.lower()
+    if suffix in _MEDIA_TYPES:
+        return _MEDIA_TYPES[suffix]
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def stat_etag(path: Path) -> str:
+    """Starlette's default ETag (from mtime and size), for files without a content hash."""
+    stat = path.stat()
+    return '"' + hashlib.md5(f"{stat.st_mtime}-{stat.st_size}".encode(), usedforsecurity=False).hexdigest() + '"'
+
+
+def object_etag(key: str, stat: storage.ObjectStat) -> str:
+    """Weak-ish validator for a stored object from its key, mtime and size (like stat_etag)."""
+    tag = hashlib.md5(f"{key}-{stat.mtime}-{stat.size}".encode(), usedforsecurity=False).hexdigest()
+    return f'"{tag}"'
+
+
+def content_disposition(filename: str, inline: bool = False) -> str:
+    """Content-Disposition naming `filename`, as FileResponse writes it."""
+    disposition_type = "inline" if inline else "attachment"
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition_type}; filename*=utf-8''{quoted}"
+    return f'{disposition_type}; filename="{filename}"'
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def accepted_encoding(request: Request, offered: list[str]) -> Optional[str]:
+    """The first of `offered` (in server preference order) that Accept-Encoding allows."""
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.strip().lower().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            accepted[coding] = q
+    for coding in offered:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def _negotiate(
+    request: Request,
+    etag: str,
+    last_modified: float,
+    cache_control: str,
+    headers: Optional[dict],
+    encodings: list[str],
+) -> tuple[Optional[str], dict]:
+    """Pick a Content-Encoding from `encodings` and build the caching headers for it."""
+    cache_headers = {
+        "Last-Modified": formatdate(last_modified, usegmt=True),
+        "Cache-Control": cache_control,
+        **(headers or {}),
+    }
+    encoding = None
+    if encodings:
+        cache_headers["Vary"] = "Accept-Encoding"
+        encoding = accepted_encoding(request, encodings)
+        if encoding:
+            # Each encoding is a different representation, so it needs its own ETag
+            etag = f'{etag[:-1]}-{encoding}"'
+            cache_headers["Content-Encoding"] = encoding
+    cache_headers["ETag"] = etag
+    return encoding, cache_headers
+
+
+def conditional_file_response(
+    request: Request,
+    path: Path,
+    name: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[float] = None,
+    cache_control: str = "no-cache",
+    headers: Optional[dict] = None,
+    variants: Optional[dict[str, Path]] = None,
+    download_name: Optional[str] = None,
+    inline: bool = False,
+) -> Response:
+    """
+    Serve `path` with the media type of `name`. `etag` must be a quoted
+    strong validator (defaults to stat_etag); `last_modified` defaults to
+    the file's mtime. `variants` maps Content-Encodings to precompressed
+    copies of the file, in order of preference. With `download_name` a
+    Content-Disposition (attachment, or inline) names the file.
+    """
+    etag = etag or stat_etag(path)
+    if last_modified is None:
+        last_modified = path.stat().st_mtime
+    encoding, cache_headers = _negotiate(
+        request, etag, last_modified, cache_control, headers, list(variants or {})
+    )
+    if encoding:
+        path = variants[encoding]
+    if is_not_modified(request, cache_headers["ETag"], last_modified):
+        return Response(status_code=304, headers=cache_headers)
+    return FileResponse(
+        path,
+        media_type=guess_media_type(name),
+        headers=cache_headers,
+        filename=download_name,
+        content_disposition_type="inline" if inline else "attachment",
+    )
+
+
+def stored_file_response(
+    request: Request,
+    key: str,
+    name: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[float] = None,
+    cache_control: str = "no-cache",
+    headers: Optional[dict] = None,
+    variants: Optional[dict[str, str]] = None,
+    download_name: Optional[str] = None,
+    inline: bool = False,
+) -> Response:
+    """
+    conditional_file_response for the object `key` (`variants` maps
+    Content-Encodings to keys). Remote objects are redirected to a
+    presigned URL when storage.PRESIGNED_URLS is on, and otherwise
+    streamed through the app without Range support.
+    Raises FileNotFoundError if there is no such object.
+    """
+    backend = storage.backend
+    path = backend.local_path(key)
+    if path is not None:
+        if not path.is_file():
+            raise FileNotFoundError(key)
+        local_variants = {encoding: backend.local_path(k) for encoding, k in (variants or {}).items()}
+        return conditional_file_response(
+            request, path, name, etag, last_modified, cache_control, headers,
+            local_variants or None, download_name, inline,
+        )
+
+    stat = backend.stat(key)
+    if stat is None:
+        raise FileNotFoundError(key)
+    if etag is None:
+        etag = object_etag(key, stat)
+    if last_modified is None:
+        last_modified = stat.mtime
+    encoding, cache_headers = _negotiate(
+        request, etag, last_modified, cache_control, headers, list(variants or {})
+    )
+    if encoding:
+        key = variants[encoding]
+        stat = backend.stat(key) or stat
+    if is_not_modified(request, cache_headers["ETag"], last_modified):
+        return Response(status_code=304, headers=cache_headers)
+
+    media_type = guess_media_type(name)
+    disposition = content_disposition(download_name, inline) if download_name else None
+    if storage.PRESIGNED_URLS:
+        url = backend.presigned_url(
+            key,
+            content_type=media_type,
+            content_disposition=disposition,
+            content_encoding=encoding,
+            cache_control=cache_control,
+        )
+        # The URL expires, so the redirect itself must not be reused
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+    if disposition:
+        cache_headers["Content-Disposition"] = disposition
+    cache_headers["Content-Length"] = str(stat.size)
+    if request.method == "HEAD":
+        return Response(status_code=200, media_type=media_type, headers=cache_headers)
+    return StreamingResponse(storage.iter_object(key), media_type=media_type, headers=cache_headers)
+
+
+def conditional_bytes_response(
+    request: Request,
+    bodies: dict[Optional[str], bytes],
+    name: str,
+    etag: str,
+    last_modified: float,
+    cache_control: str = "no-cache",
+) -> Response:
+    """
+    In-memory counterpart of conditional_file_response (no Range support).
+    `bodies` maps Content-Encodings to content; None is the plain content.
+    """
+    encoding, cache_headers = _negotiate(
+        request, etag, last_modified, cache_control, None, [e for e in bodies if e]
+    )
+    if is_not_modified(request, cache_headers["ETag"], last_modified):
+        return Response(status_code=304, headers=cache_headers)
+    if request.method == "HEAD":
+        cache_headers["Content-Length"] = str(len(bodies[encoding]))
+        return Response(status_code=200, media_type=guess_media_type(name), headers=cache_headers)
+    return Response(bodies[encoding], media_type=guess_media_type(name), headers=cache_headers)
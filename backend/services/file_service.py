@@ -1,33 +1,388 @@
 """
-Manages the storage/ directory layout:
-  storage/{assignment_id}/original/   <- immutable source files
+Manages the layout of assignment files in object storage (storage.py;
+by default the storage/ directory):
+  blobs/{sha[:2]}/{sha}          <- imported file contents, keyed by git blob SHA
+  blobs/{sha[:2]}/{sha}.gz|.br   <- precompressed copies of text blobs (precompress_blobs)
+  {assignment_id}/manifest.json  <- {path: sha} for each imported assignment
+  {assignment_id}/import_manifest.json
+                                 <- include/exclude rules sent with the import, if any
+  {assignment_id}/original/      <- source files of assignments imported
+                                    before the blob store (read-only)
+Blobs are shared between assignments and uploaded materials
+(material_service.py); Blob.ref_count tracks how many manifests and
+materials point at each one and the object is removed when it drops to zero.
+Blobs are assembled in TMP_DIR on the local disk and stored once verified.
 """
 from pathlib import Path
+import asyncio
+import contextlib
+import gzip
+import hashlib
+import json
+import os
 import shutil
+import uuid
+from typing import AsyncIterator, BinaryIO, Optional
 
-STORAGE_ROOT = Path(__file__).parent.parent / "storage"
+import aiofiles
+import aiofiles.os
+from sqlmodel import Session, func, select, update
 
+try:
+    import brotli
+except ImportError:  # a dependency, but without it only .gz variants are written
+    brotli = None
 
-def assignment_original_dir(assignment_id: int) -> Path:
-    return STORAGE_ROOT / str(assignment_id) / "original"
+from ..models.blob import Blob
+from . import storage
+from .storage import STORAGE_ROOT
 
+TMP_DIR = STORAGE_ROOT / "tmp"  # local scratch space, whatever the storage backend
 
-def ensure_assignment_dirs(assignment_id: int) -> None:
-    assignment_original_dir(assignment_id).mkdir(parents=True, exist_ok=True)
+# Precompressed variants: Content-Encoding -> suffix, in order of preference
+VARIANT_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+COMPRESSIBLE_SUFFIXES = {
+    ".html", ".htm", ".css", ".js", ".mjs", ".json", ".map", ".svg",
+    ".txt", ".csv", ".md", ".xml", ".ico", ".wasm",
+}
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_MIN_SAVING = 0.1  # keep a variant only if it is at least 10% smaller
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "11"))
 
 
-def save_file(assignment_id: int, filename: str, content: bytes) -> Path:
-    ensure_assignment_dirs(assignment_id)
-    dest = assignment_original_dir(assignment_id) / filename
-    dest.write_bytes(content)
-    return dest
+def blob_key(sha: str) -> str:
+    return f"blobs/{sha[:2]}/{sha}"
 
 
-def get_entry_file(assignment_id: int, file_path: str) -> Path:
-    return assignment_original_dir(assignment_id) / file_path
+def has_blob(sha: str) -> bool:
+    return storage.backend.stat(blob_key(sha)) is not None
 
 
-def delete_assignment_files(assignment_id: int) -> None:
-    dir_path = STORAGE_ROOT / str(assignment_id)
-    if dir_path.exists():
-        shutil.rmtree(dir_path)
+def blob_hasher(size: int):
+    """A hashlib object that yields git's blob SHA (as in tree listings) of `size` bytes of content."""
+    return hashlib.sha1(b"blob %d\0" % size)
+
+
+class BlobMismatch(ValueError):
+    """Content doesn't match the SHA and size it was listed with (e.g. the branch moved)."""
+
+
+class BlobWriter:
+    """
+    Checks one blob's content as it streams in: the git blob SHA is
+    computed incrementally and the write stops as soon as more than the
+    declared `size` arrives. Content goes to a temp file that is only
+    stored once verified, so a partial download never lands in the store.
+    Raises BlobMismatch on oversize or mismatched content.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, sha: str, size: int):
+        self.sha = sha
+        self.size = size
+        self.written = 0
+        self.key = blob_key(sha)
+        self.tmp = TMP_DIR / f"{sha}.{uuid.uuid4().hex}.tmp"
+        self._hash = blob_hasher(size)
+
+    def update(self, chunk: bytes) -> None:
+        self.written += len(chunk)
+        if self.written > self.size:
+            raise BlobMismatch(f"Blob {self.sha} is larger than its declared {self.size} bytes")
+        self._hash.update(chunk)
+
+    def verify(self) -> None:
+        if self.written != self.size or self._hash.hexdigest() != self.sha:
+            raise BlobMismatch(f"Content does not match blob {self.sha}")
+
+
+async def write_blob(sha: str, size: int, chunks: AsyncIterator[bytes]) -> int:
+    """Stream `chunks` into the blob store with async file I/O. Returns bytes written."""
+    writer = BlobWriter(sha, size)
+    await aiofiles.os.makedirs(TMP_DIR, exist_ok=True)
+    try:
+        async with aiofiles.open(writer.tmp, "wb") as out:
+            async for chunk in chunks:
+                writer.update(chunk)
+                await out.write(chunk)
+        writer.verify()
+        await asyncio.to_thread(storage.backend.put_file, writer.key, writer.tmp)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            await aiofiles.os.remove(writer.tmp)
+        raise
+    return writer.written
+
+
+def copy_blob(sha: str, size: int, source: BinaryIO) -> int:
+    """Blocking counterpart of write_blob for worker threads. Returns bytes written."""
+    writer = BlobWriter(sha, size)
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(writer.tmp, "wb") as out:
+            while chunk := source.read(BlobWriter.CHUNK_SIZE):
+                writer.update(chunk)
+                out.write(chunk)
+        writer.verify()
+        storage.backend.put_file(writer.key, writer.tmp)
+    except BaseException:
+        writer.tmp.unlink(missing_ok=True)
+        raise
+    return writer.written
+
+
+def blob_usage(session: Session) -> dict:
+    """Size of the blob store, and how much sharing blobs saves."""
+    count, stored, referenced = session.exec(
+        select(
+            func.count(Blob.sha),
+            func.coalesce(func.sum(Blob.size), 0),
+            func.coalesce(func.sum(Blob.size * Blob.ref_count), 0),
+        )
+    ).one()
+    return {
+        "blobs": count,
+        "stored_bytes": stored,
+        "referenced_bytes": referenced,
+        "bytes_saved": referenced - stored,
+    }
+
+
+def add_blob_refs(session: Session, blobs: dict[str, int]) -> None:
+    """Take one reference on each blob in {sha: size}."""
+    for sha, size in blobs.items():
+        result = session.exec(
+            update(Blob).where(Blob.sha == sha).values(ref_count=Blob.ref_count + 1)
+        )
+        if result.rowcount == 0:
+            session.add(Blob(sha=sha, size=size, ref_count=1))
+    session.commit()
+
+
+def take_stored_blob_refs(session: Session, shas: set[str]) -> set[str]:
+    """
+    Take one reference on each of `shas` already in the store, in one
+    transaction. Returns those shas; the rest have yet to be stored (and
+    referenced with add_blob_refs once they are).
+    """
+    if not shas:
+        return set()
+    session.exec(update(Blob).where(Blob.sha.in_(shas)).values(ref_count=Blob.ref_count + 1))
+    stored = set(session.exec(select(Blob.sha).where(Blob.sha.in_(shas))).all())
+    session.commit()
+    return stored
+
+
+def release_blob_refs(session: Session, shas: set[str]) -> int:
+    """Drop one reference on each blob; delete the ones nothing points at. Returns bytes freed."""
+    if not shas:
+        return 0
+    session.exec(
+        update(Blob).where(Blob.sha.in_(shas)).values(ref_count=Blob.ref_count - 1)
+    )
+    freed = 0
+    unreferenced = session.exec(
+        select(Blob).where(Blob.sha.in_(shas), Blob.ref_count <= 0)
+    ).all()
+    for blob in unreferenced:
+        freed += delete_blob_objects(blob.sha)
+        session.delete(blob)
+    session.commit()
+    return freed
+
+
+def delete_blob_objects(sha: str) -> int:
+    """Remove a blob and its variants from storage. Returns bytes freed."""
+    freed = 0
+    for key in (blob_key(sha), *(variant_key(sha, e) for e in VARIANT_SUFFIXES)):
+        stat = storage.backend.stat(key)
+        if stat is not None:
+            freed += stat.size
+            storage.backend.delete(key)
+    return freed
+
+
+def variant_key(sha: str, encoding: str) -> str:
+    return blob_key(sha) + VARIANT_SUFFIXES[encoding]
+
+
+def variant_stats(sha: str) -> dict[str, storage.ObjectStat]:
+    """{Content-Encoding: stat} of the precompressed copies a blob has."""
+    stats = {encoding: storage.backend.stat(variant_key(sha, encoding)) for encoding in VARIANT_SUFFIXES}
+    return {encoding: stat for encoding, stat in stats.items() if stat is not None}
+
+
+def blob_variants(sha: str) -> dict[str, str]:
+    """{Content-Encoding: key} of the precompressed copies a blob has, in order of preference."""
+    return {encoding: variant_key(sha, encoding) for encoding in variant_stats(sha)}
+
+
+def is_compressible(file_path: str, size: int) -> bool:
+    return size >= COMPRESS_MIN_BYTES and Path(file_path).suffix.lower() in COMPRESSIBLE_SUFFIXES
+
+
+def _write_variant(sha: str, size: int, encoding: str) -> int:
+    """Compress a blob to a temp file chunk by chunk. Returns the compressed size."""
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = TMP_DIR / f"{sha}.{uuid.uuid4().hex}{VARIANT_SUFFIXES[encoding]}"
+    try:
+        with storage.backend.open(blob_key(sha)) as source, open(tmp, "wb") as out:
+            if encoding == "gzip":
+                # mtime=0 keeps the output (and so its ETag) reproducible
+                with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=9, mtime=0) as gz:
+                    shutil.copyfileobj(source, gz, BlobWriter.CHUNK_SIZE)
+            else:
+                compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+                while chunk := source.read(BlobWriter.CHUNK_SIZE):
+                    out.write(compressor.process(chunk))
+                out.write(compressor.finish())
+        compressed = tmp.stat().st_size
+        if compressed > size * (1 - COMPRESS_MIN_SAVING):
+            tmp.unlink()  # not worth a Content-Encoding round trip
+            return 0
+        storage.backend.put_file(variant_key(sha, encoding), tmp)
+        return compressed
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def precompress_blobs(manifest: dict[str, str]) -> dict:
+    """
+    Post-import stage: write missing .gz/.br copies of the compressible
+    blobs in a {path: sha} manifest (.br only when brotli is installed).
+    Blocking and CPU-bound; run it in a worker thread.
+    Returns {"compressed", "variant_bytes"} for the variants written.
+    """
+    encodings = [e for e in VARIANT_SUFFIXES if e != "br" or brotli is not None]
+    compressed = variant_bytes = 0
+    for path, sha in manifest.items():
+        if Path(path).suffix.lower() not in COMPRESSIBLE_SUFFIXES:
+            continue  # skip the stat
+        blob = storage.backend.stat(blob_key(sha))
+        if blob is None or not is_compressible(path, blob.size):
+            continue
+        existing = variant_stats(sha)
+        for encoding in encodings:
+            if encoding not in existing:
+                size = _write_variant(sha, blob.size, encoding)
+                compressed += bool(size)
+                variant_bytes += size
+    return {"compressed": compressed, "variant_bytes": variant_bytes}
+
+
+def compression_report(assignment_id: int) -> Optional[dict]:
+    """Per-file sizes of an assignment's compressed copies and the bytes they save per transfer."""
+    manifest = read_manifest(assignment_id)
+    if manifest is None:
+        return None
+    files = []
+    for path, sha in sorted(manifest.items()):
+        if Path(path).suffix.lower() not in COMPRESSIBLE_SUFFIXES:
+            continue
+        variants = variant_stats(sha)
+        blob = storage.backend.stat(blob_key(sha)) if variants else None
+        if blob is None:
+            continue
+        size = blob.size
+        sizes = {encoding: stat.size for encoding, stat in variants.items()}
+        best = min(sizes.values())
+        files.append({
+            "path": path,
+            "size": size,
+            **sizes,
+            "ratio": round(best / size, 3),
+            "saved": size - best,
+        })
+    original = sum(f["size"] for f in files)
+    saved = sum(f["saved"] for f in files)
+    return {
+        "assignment_id": assignment_id,
+        "files": len(manifest),
+        "compressed_files": len(files),
+        "compressible_bytes": original,
+        "bytes_saved": saved,
+        "ratio": round((original - saved) / original, 3) if original else None,
+        "by_file": files,
+    }
+
+
+def original_prefix(assignment_id: int) -> str:
+    return f"{assignment_id}/original/"
+
+
+def manifest_key(assignment_id: int) -> str:
+    return f"{assignment_id}/manifest.json"
+
+
+def read_manifest(assignment_id: int) -> Optional[dict[str, str]]:
+    """{path: sha} for an imported assignment, or None for legacy/unknown ones."""
+    data = storage.backend.read_bytes(manifest_key(assignment_id))
+    return None if data is None else json.loads(data)
+
+
+def write_manifest(assignment_id: int, manifest: dict[str, str]) -> None:
+    storage.backend.put_bytes(manifest_key(assignment_id), json.dumps(manifest, sort_keys=True).encode())
+
+
+def import_manifest_key(assignment_id: int) -> str:
+    return f"{assignment_id}/import_manifest.json"
+
+
+def read_import_manifest(assignment_id: int) -> Optional[dict]:
+    data = storage.backend.read_bytes(import_manifest_key(assignment_id))
+    return None if data is None else json.loads(data)
+
+
+def write_import_manifest(assignment_id: int, rules: dict) -> None:
+    storage.backend.put_bytes(import_manifest_key(assignment_id), json.dumps(rules).encode())
+
+
+def clean_relative_path(path: str) -> Optional[str]:
+    """Normalise a URL path inside an assignment; None if it tries to leave it."""
+    parts = [p for p in path.replace("\\", "/").split("/") if p not in ("", ".")]
+    if any(p == ".." for p in parts):
+        return None
+    return "/".join(parts)
+
+
+def resolve_file(assignment_id: int, file_path: str) -> Optional[tuple[str, Optional[str]]]:
+    """
+    (storage key, blob sha) for a file of an assignment, or None if it
+    has no such file. The sha is None for pre-blob-store assignments.
+    """
+    file_path = clean_relative_path(file_path)
+    if not file_path:
+        return None
+    manifest = read_manifest(assignment_id)
+    if manifest is not None:
+        sha = manifest.get(file_path)
+        return (blob_key(sha), sha) if sha else None
+    key = original_prefix(assignment_id) + file_path
+    if storage.backend.stat(key) is None:
+        return None  # missing, or e.g. a symlink pointing outside the assignment
+    return key, None
+
+
+def list_original_files(assignment_id: int) -> list[tuple[str, storage.ObjectStat]]:
+    """(path, stat) of a pre-blob-store assignment's files."""
+    prefix = original_prefix(assignment_id)
+    return [(key[len(prefix):], stat) for key, stat in storage.backend.list(prefix)]
+
+
+def delete_legacy_files(assignment_id: int) -> None:
+    """Remove the pre-blob-store original/ copy once a manifest replaces it."""
+    for key, _ in list(storage.backend.list(original_prefix(assignment_id))):
+        storage.backend.delete(key)
+
+
+def delete_assignment_files(session: Session, assignment_id: int) -> int:
+    """Remove an assignment's manifests and legacy files and release its blobs. Returns bytes freed."""
+    freed = 0
+    manifest = read_manifest(assignment_id)
+    if manifest:
+        freed += release_blob_refs(session, set(manifest.values()))
+    for key, stat in list(storage.backend.list(f"{assignment_id}/")):
+        storage.backend.delete(key)
+        freed += stat.size
+    return freed
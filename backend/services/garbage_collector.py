@@ -0,0 +1,277 @@
+"""
+Background removal of deleted data, and of storage nothing points at.
+
+Deleting an assignment, material or comment only sets its deleted_at
+(reads treat such rows as gone), so the request returns at once. A
+collector started from the app lifespan then purges marked rows every
+INTERVAL seconds, BATCH_SIZE rows of each kind at a time:
+  comments       marked ones, and all comments of deleted assignments
+  materials      likewise, releasing their blob reference or legacy file
+  assignments    once their comments and materials are gone and no
+                 import is running: upload sessions, manifests and
+                 legacy files, blob references, then the row itself
+
+Every ORPHAN_SWEEP_SECONDS it also sweeps storage against the database:
+  - objects with no row: blobs without a Blob row, legacy material files
+    no material points at, "{assignment_id}/..." keys of assignments
+    that don't exist, and temp files left by interrupted writes
+  - rows with no object: materials whose file is missing are marked
+    deleted; unreferenced Blob rows are dropped, and referenced Blob
+    rows whose object is missing are counted in the report
+Anything newer than ORPHAN_GRACE_SECONDS is left alone, since uploads
+and imports store objects before committing the rows that point at them.
+An import only adds its Blob rows once the whole tree is downloaded,
+which can take longer than that, so blobs are not swept at all while an
+import job is queued or running; the next sweep gets them.
+Bytes reclaimed are reported at GET /api/admin/gc.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlmodel import Session, delete, func, select, update
+
+from ..database import engine
+from ..models.assignment import Assignment
+from ..models.blob import Blob
+from ..models.comment import Comment
+from ..models.import_job import ImportJob
+from ..models.supplementary_material import SupplementaryMaterial
+from ..models.upload_session import UploadSession
+from . import file_service, material_service, serve_cache, storage, upload_sessions
+
+INTERVAL = float(os.environ.get("GC_INTERVAL_SECONDS", "60"))
+BATCH_SIZE = int(os.environ.get("GC_BATCH_SIZE", "200"))
+ORPHAN_SWEEP_SECONDS = float(os.environ.get("GC_ORPHAN_SWEEP_SECONDS", str(6 * 3600)))
+ORPHAN_GRACE_SECONDS = float(os.environ.get("GC_ORPHAN_GRACE_SECONDS", "3600"))
+
+_collector: Optional[asyncio.Task] = None
+
+stats = {
+    "assignments_purged": 0,
+    "materials_purged": 0,
+    "comments_purged": 0,
+    "orphan_objects": 0,
+    "orphan_rows": 0,
+    "bytes_reclaimed": 0,
+    "last_collect": None,
+    "last_sweep": None,
+}
+
+
+def mark_deleted(session: Session, row) -> None:
+    """Soft-delete an Assignment, SupplementaryMaterial or Comment (commits `session`)."""
+    row.deleted_at = datetime.utcnow()
+    session.add(row)
+    session.commit()
+
+
+def _deleted_assignments():
+    return select(Assignment.id).where(Assignment.deleted_at.is_not(None))
+
+
+def _marked(model, batch_size: int, column=None):
+    """Rows (or `column`) marked deleted, oldest first; the ORDER BY also lets SQLite use the deleted_at index."""
+    return (
+        select(model if column is None else column)
+        .where(model.deleted_at.is_not(None))
+        .order_by(model.deleted_at)
+        .limit(batch_size)
+    )
+
+
+def _purge_comments(session: Session, batch_size: int) -> int:
+    ids = session.exec(_marked(Comment, batch_size, Comment.id)).all()
+    ids += session.exec(
+        select(Comment.id).where(Comment.assignment_id.in_(_deleted_assignments())).limit(batch_size - len(ids))
+    ).all()
+    ids = list(dict.fromkeys(ids))
+    if ids:
+        # Replies outlive a deleted parent, as before soft deletes
+        session.exec(update(Comment).where(Comment.parent_id.in_(ids)).values(parent_id=None))
+        session.exec(delete(Comment).where(Comment.id.in_(ids)))
+        session.commit()
+    return len(ids)
+
+
+def _purge_materials(session: Session, batch_size: int) -> tuple[int, int]:
+    materials = session.exec(_marked(SupplementaryMaterial, batch_size)).all()
+    materials += session.exec(
+        select(SupplementaryMaterial)
+        .where(SupplementaryMaterial.assignment_id.in_(_deleted_assignments()))
+        .limit(batch_size - len(materials))
+    ).all()
+    materials = list({material.id: material for material in materials}.values())
+    freed = 0
+    for material in materials:
+        session.delete(material)
+        freed += material_service.release_material_file(session, material)
+    return len(materials), freed
+
+
+def _purge_assignment(session: Session, assignment: Assignment) -> Optional[int]:
+    """Remove a deleted assignment whose comments and materials are gone. Returns bytes freed, or None if not yet."""
+    aid = assignment.id
+    remaining = session.exec(select(func.count(Comment.id)).where(Comment.assignment_id == aid)).one()
+    remaining += session.exec(
+        select(func.count(SupplementaryMaterial.id)).where(SupplementaryMaterial.assignment_id == aid)
+    ).one()
+    if remaining:
+        return None
+    # Queued imports would fail on the missing assignment anyway; a running one is waited for
+    session.exec(
+        update(ImportJob)
+        .where(ImportJob.assignment_id == aid, ImportJob.status == "queued")
+        .values(status="failed", error="Assignment was deleted", finished_at=datetime.utcnow())
+    )
+    session.commit()
+    if session.exec(
+        select(ImportJob.id).where(ImportJob.assignment_id == aid, ImportJob.status == "running")
+    ).first():
+        return None
+    session.exec(update(ImportJob).where(ImportJob.assignment_id == aid).values(assignment_id=None))
+    for upload in session.exec(select(UploadSession).where(UploadSession.assignment_id == aid)).all():
+        upload_sessions.discard(upload.id)
+        session.delete(upload)
+    freed = file_service.delete_assignment_files(session, aid)
+    session.delete(assignment)
+    session.commit()
+    serve_cache.invalidate(aid)
+    return freed
+
+
+def collect(batch_size: int = BATCH_SIZE) -> dict:
+    """Purge up to `batch_size` deleted rows of each kind, with their files."""
+    result = {"assignments": 0, "materials": 0, "comments": 0, "bytes_reclaimed": 0}
+    # Each release commits; the rest of the batch must stay readable after it
+    with Session(engine, expire_on_commit=False) as session:
+        result["comments"] = _purge_comments(session, batch_size)
+        result["materials"], freed = _purge_materials(session, batch_size)
+        result["bytes_reclaimed"] += freed
+        assignments = session.exec(_marked(Assignment, batch_size)).all()
+        for assignment in assignments:
+            freed = _purge_assignment(session, assignment)
+            if freed is not None:
+                result["assignments"] += 1
+                result["bytes_reclaimed"] += freed
+
+    stats["assignments_purged"] += result["assignments"]
+    stats["materials_purged"] += result["materials"]
+    stats["comments_purged"] += result["comments"]
+    stats["bytes_reclaimed"] += result["bytes_reclaimed"]
+    stats["last_collect"] = {"at": datetime.utcnow().isoformat() + "Z", **result}
+    return result
+
+
+def _is_orphan(key: str, blob_shas: set, legacy_files: set, assignment_ids: set) -> bool:
+    name = key.rsplit("/", 1)[-1]
+    top = key.split("/", 1)[0]
+    if key.startswith(material_service.BLOB_PREFIX):
+        owned = name.split(".", 1)[0] in blob_shas  # the blob or one of its variants
+    elif key.startswith(material_service.LEGACY_PREFIX):
+        owned = key[len(material_service.LEGACY_PREFIX):] in legacy_files
+    elif top.isdigit():
+        owned = int(top) in assignment_ids
+    else:
+        return False  # not ours (e.g. local scratch space or the GitHub cache)
+    return not owned or name.endswith(".tmp")  # .tmp: an interrupted LocalStorage write
+
+
+def sweep_orphans(grace: float = ORPHAN_GRACE_SECONDS) -> dict:
+    """Reconcile storage with the database (see the module docstring)."""
+    cutoff = time.time() - grace
+    cutoff_dt = datetime.utcnow() - timedelta(seconds=grace)
+    # List before reading rows: anything stored after the listing started is within the grace period
+    objects = list(storage.backend.list(""))
+    present = {key for key, _ in objects}
+    result = {"orphan_objects": 0, "orphan_rows": 0, "missing_blobs": 0, "bytes_reclaimed": 0}
+
+    with Session(engine) as session:
+        blob_shas = set(session.exec(select(Blob.sha)).all())
+        assignment_ids = set(session.exec(select(Assignment.id)).all())
+        legacy_files = set(session.exec(
+            select(SupplementaryMaterial.file_path).where(
+                SupplementaryMaterial.file_path.is_not(None),
+                ~SupplementaryMaterial.file_path.startswith(material_service.BLOB_PREFIX),
+            )
+        ).all())
+        importing = session.exec(
+            select(ImportJob.id).where(ImportJob.status.in_(("queued", "running"))).limit(1)
+        ).first() is not None
+        for key, stat in objects:
+            if importing and key.startswith(material_service.BLOB_PREFIX):
+                continue  # may be part of a download whose rows aren't committed yet
+            if stat.mtime < cutoff and _is_orphan(key, blob_shas, legacy_files, assignment_ids):
+                storage.backend.delete(key)
+                result["orphan_objects"] += 1
+                result["bytes_reclaimed"] += stat.size
+
+        # Materials whose file is gone: the collector releases their references
+        materials = session.exec(
+            select(SupplementaryMaterial).where(
+                SupplementaryMaterial.file_path.is_not(None),
+                SupplementaryMaterial.deleted_at.is_(None),
+                SupplementaryMaterial.created_at < cutoff_dt,
+            )
+        ).all()
+        for material in materials:
+            if material_service.material_key(material.file_path) not in present:
+                material.deleted_at = datetime.utcnow()
+                session.add(material)
+                result["orphan_rows"] += 1
+        session.commit()
+
+        for blob in session.exec(select(Blob).where(Blob.created_at < cutoff_dt)).all():
+            if blob.ref_count <= 0:
+                result["bytes_reclaimed"] += file_service.delete_blob_objects(blob.sha)
+                session.delete(blob)
+                result["orphan_rows"] += 1
+            elif file_service.blob_key(blob.sha) not in present:
+                result["missing_blobs"] += 1
+        session.commit()
+
+    stats["orphan_objects"] += result["orphan_objects"]
+    stats["orphan_rows"] += result["orphan_rows"]
+    stats["bytes_reclaimed"] += result["bytes_reclaimed"]
+    stats["last_sweep"] = {"at": datetime.utcnow().isoformat() + "Z", **result}
+    return result
+
+
+def get_stats() -> dict:
+    pending = {}
+    with Session(engine) as session:
+        for name, model in (
+            ("assignments", Assignment), ("materials", SupplementaryMaterial), ("comments", Comment)
+        ):
+            pending[name] = session.exec(select(func.count(model.id)).where(model.deleted_at.is_not(None))).one()
+    return {**stats, "pending": pending}
+
+
+async def _collect_loop() -> None:
+    next_sweep = 0.0
+    while True:
+        busy = False
+        try:
+            result = await asyncio.to_thread(collect)
+            busy = max(result["comments"], result["materials"], result["assignments"]) >= BATCH_SIZE
+            if time.monotonic() >= next_sweep:
+                await asyncio.to_thread(sweep_orphans)
+                next_sweep = time.monotonic() + ORPHAN_SWEEP_SECONDS
+        except Exception:
+            pass  # try again next round
+        await asyncio.sleep(0 if busy else INTERVAL)
+
+
+async def start() -> None:
+    global _collector
+    _collector = asyncio.create_task(_collect_loop())
+
+
+async def stop() -> None:
+    if _collector is not None:
+        _collector.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _collector
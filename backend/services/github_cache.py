@@ -0,0 +1,213 @@
+"""
+Conditional-request cache for GitHub REST metadata (repo info, branch
+lists, trees).
+
+Responses are kept in memory (the last GITHUB_CACHE_MEMORY_ENTRIES) and
+persisted under storage/cache/github/ (least recently used files dropped
+past GITHUB_CACHE_DISK_BYTES) together with their ETag / Last-Modified
+validators:
+  - fresh entries (younger than max_age) are served without a request
+  - stale entries are served immediately while a background request
+    revalidates them with If-None-Match / If-Modified-Since
+  - entries older than STALE_SECONDS are revalidated before returning
+A 304 from GitHub does not count against the rate limit. Concurrent
+requests for the same key share one upstream fetch (single-flight).
+Entries are keyed by URL and by a fingerprint of the caller's token, so a
+response fetched with one user's credentials (say, from a private repo)
+is never served to a request made with another's.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+
+from .file_service import STORAGE_ROOT
+
+CACHE_DIR = STORAGE_ROOT / "cache" / "github"
+FRESH_SECONDS = float(os.environ.get("GITHUB_CACHE_FRESH_SECONDS", "60"))
+STALE_SECONDS = float(os.environ.get("GITHUB_CACHE_STALE_SECONDS", str(24 * 3600)))
+MAX_MEMORY_ENTRIES = int(os.environ.get("GITHUB_CACHE_MEMORY_ENTRIES", "1024"))
+DISK_BYTES = int(os.environ.get("GITHUB_CACHE_DISK_BYTES", str(128 * 1024 * 1024)))
+
+Fetch = Callable[[dict], Awaitable[httpx.Response]]
+
+stats = {
+    "hits": 0,            # served fresh, no request made
+    "misses": 0,          # nothing cached, full request
+    "stale_served": 0,    # served stale while revalidating in the background
+    "revalidations": 0,   # conditional requests sent
+    "not_modified": 0,    # revalidations answered with 304
+    "coalesced": 0,       # callers that joined a fetch already in flight
+    "disk_evictions": 0,  # files dropped to stay under DISK_BYTES
+}
+
+_memory: "OrderedDict[str, dict]" = OrderedDict()
+_pending: dict[str, asyncio.Task] = {}
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def _credential(token: Optional[str]) -> str:
+    """Cache key prefix for `token`: a hash of it, or "anon" for the server's pool."""
+    return hashlib.sha256(token.encode()).hexdigest()[:16] if token else "anon"
+
+
+def _disk_path(key: str):
+    return CACHE_DIR / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+
+def _write_entry(key: str, entry: dict) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _disk_path(key)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(entry), encoding="utf-8")
+    os.replace(tmp, path)
+
+    files = []
+    for p in CACHE_DIR.glob("*.json"):
+        with contextlib.suppress(FileNotFoundError):  # evicted by a concurrent write
+            files.append((p.stat(), p))
+    total = sum(st.st_size for st, _ in files)
+    for st, p in sorted(files, key=lambda item: item[0].st_mtime):
+        if total <= DISK_BYTES:
+            break
+        p.unlink(missing_ok=True)
+        total -= st.st_size
+        stats["disk_evictions"] += 1
+
+
+def _remember(key: str, entry: dict) -> None:
+    _memory[key] = entry
+    _memory.move_to_end(key)
+    while len(_memory) > MAX_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def _load(key: str) -> Optional[dict]:
+    entry = _memory.get(key)
+    if entry is not None:
+        _memory.move_to_end(key)
+        return entry
+    path = _disk_path(key)
+    if not path.exists():
+        return None
+    try:
+        entry = json.loads(path.read_text(encoding="utf-8"))
+        os.utime(path)  # mark as recently used for eviction
+    except (OSError, ValueError):
+        return None
+    _remember(key, entry)
+    return entry
+
+
+async def _store(key: str, resp: httpx.Response) -> dict:
+    entry = {
+        "url": key,
+        "etag": resp.headers.get("etag"),
+        "last_modified": resp.headers.get("last-modified"),
+        "link": resp.headers.get("link"),  # pagination
+        "body": resp.json(),
+        "fetched_at": time.time(),
+    }
+    _remember(key, entry)
+    await asyncio.to_thread(_write_entry, key, entry)
+    return entry
+
+
+async def _revalidate(key: str, entry: dict, fetch: Fetch) -> dict:
+    stats["revalidations"] += 1
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    resp = await fetch(headers)
+    if resp.status_code == 304:
+        stats["not_modified"] += 1
+        entry = {**entry, "fetched_at": time.time()}
+        _remember(key, entry)
+        await asyncio.to_thread(_write_entry, key, entry)
+        return entry
+    resp.raise_for_status()
+    return await _store(key, resp)
+
+
+def _revalidate_in_background(key: str, entry: dict, fetch: Fetch) -> None:
+    if key in _pending:
+        return
+
+    async def run():
+        try:
+            await _revalidate(key, entry, fetch)
+        except Exception:
+            pass  # keep serving the stale copy; the next request retries
+        finally:
+            _pending.pop(key, None)
+
+    _pending[key] = asyncio.create_task(run())
+
+
+async def _single_flight(key: str, run: Callable[[], Awaitable[dict]]) -> dict:
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(run())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        stats["coalesced"] += 1
+    # One caller going away (client disconnect) mustn't cancel everyone's fetch
+    return await asyncio.shield(task)
+
+
+async def _fetch_new(key: str, fetch: Fetch) -> dict:
+    stats["misses"] += 1
+    resp = await fetch({})
+    resp.raise_for_status()
+    return await _store(key, resp)
+
+
+async def get_entry(
+    key: str, fetch: Fetch, max_age: Optional[float] = None, token: Optional[str] = None
+) -> dict:
+    """
+    Return the cache entry for `key` (the full request URL) as fetched
+    with `token`, calling fetch(extra_headers) when the network is needed.
+    max_age=0 forces a conditional request before returning. The entry has
+    the JSON "body" and the response's "link" header.
+    """
+    key = f"{_credential(token)}:{key}"
+    max_age = FRESH_SECONDS if max_age is None else max_age
+    entry = _load(key)
+    if entry is None:
+        return await _single_flight(key, lambda: _fetch_new(key, fetch))
+
+    age = time.time() - entry["fetched_at"]
+    if age < max_age:
+        stats["hits"] += 1
+        return entry
+    if max_age > 0 and age < STALE_SECONDS:
+        stats["stale_served"] += 1
+        _revalidate_in_background(key, entry, fetch)
+        return entry
+    return await _single_flight(key, lambda: _revalidate(key, entry, fetch))
+
+
+async def get_json(
+    key: str, fetch: Fetch, max_age: Optional[float] = None, token: Optional[str] = None
+) -> Any:
+    """The JSON body for `key`; see get_entry."""
+    return (await get_entry(key, fetch, max_age, token))["body"]
+
+
+def get_stats() -> dict:
+    return {
+        **stats,
+        "memory_entries": len(_memory),
+        "pending_revalidations": len(_pending),
+        "in_flight": len(_inflight),
+    }
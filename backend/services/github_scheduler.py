@@ -0,0 +1,189 @@
+"""
+Rate-limit budget for GitHub REST calls, spread over a pool of tokens.
+
+Tokens come from GITHUB_TOKENS (comma-separated) or GITHUB_TOKEN; with
+none configured, calls go out unauthenticated under the same accounting.
+Each response's X-RateLimit-Remaining / -Limit / -Reset headers update
+that token's budget, and every call goes to the token with the most
+budget left. Calls have a priority (see bulk()):
+  - interactive calls (previews, branch lists) may spend a token down to 0
+  - bulk calls (imports) stop at a reserve of BULK_RESERVE, or a tenth
+    of the token's limit if that is less (an anonymous budget is only
+    60 an hour), and also wait while any interactive call is waiting,
+    so imports can't starve the UI
+A 403/429 with Retry-After (secondary limits) or an exhausted budget
+blocks the token until then. When no token can be used soon enough the
+call raises RateLimited instead of hanging the request.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+BULK_RESERVE = int(os.environ.get("GITHUB_BULK_RESERVE", "100"))
+INTERACTIVE_MAX_WAIT = float(os.environ.get("GITHUB_INTERACTIVE_MAX_WAIT", "5"))
+BULK_MAX_WAIT = float(os.environ.get("GITHUB_BULK_MAX_WAIT", "60"))
+SECONDARY_LIMIT_SECONDS = 60.0  # GitHub's advice when a secondary limit gives no Retry-After
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("github_priority", default=INTERACTIVE)
+
+
+class RateLimited(Exception):
+    """No token has budget left; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"GitHub rate limit reached, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBudget:
+    def __init__(self, token: Optional[str]):
+        self.token = token
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None  # None until a response tells us
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+
+    def floor(self, priority: str) -> int:
+        if priority != BULK:
+            return 0
+        # Relative to the limit, or a reserve above it would leave bulk calls nothing
+        return min(BULK_RESERVE, (self.limit or 0) // 10)
+
+    def available_at(self, priority: str, now: float) -> float:
+        """When this token can take a call of `priority` (now, if it can already)."""
+        at = max(now, self.blocked_until)
+        if self.remaining is not None and self.remaining <= self.floor(priority) and self.reset_at > now:
+            at = max(at, self.reset_at)
+        return at
+
+    def label(self) -> str:
+        return f"…{self.token[-4:]}" if self.token else "anonymous"
+
+
+def _load_tokens() -> list[TokenBudget]:
+    raw = os.environ.get("GITHUB_TOKENS") or os.environ.get("GITHUB_TOKEN") or ""
+    tokens = [t.strip() for t in raw.split(",") if t.strip()]
+    return [TokenBudget(t) for t in tokens] or [TokenBudget(None)]
+
+
+_pool = _load_tokens()
+_explicit: dict[str, TokenBudget] = {}  # tokens passed in by callers, outside the pool
+_interactive_waiting = 0
+
+stats = {
+    "requests": 0,
+    "delayed": 0,        # calls that had to wait for budget
+    "rate_limited": 0,   # 403/429 rate-limit responses received
+    "rejected": 0,       # calls that raised RateLimited
+}
+
+
+@contextmanager
+def bulk():
+    """Run GitHub calls made inside this block (and tasks it starts) at bulk priority."""
+    reset = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(reset)
+
+
+def _pick(candidates: list[TokenBudget], priority: str, now: float) -> tuple[TokenBudget, float]:
+    def key(b: TokenBudget):
+        remaining = b.remaining if b.remaining is not None else float("inf")
+        return (b.available_at(priority, now), -remaining)
+    best = min(candidates, key=key)
+    return best, best.available_at(priority, now)
+
+
+async def acquire(token: Optional[str] = None) -> TokenBudget:
+    """Wait for a token with budget for one call and reserve it."""
+    global _interactive_waiting
+    priority = _priority.get()
+    if token:
+        candidates = [_explicit.setdefault(token, TokenBudget(token))]
+    else:
+        candidates = _pool
+    max_wait = BULK_MAX_WAIT if priority == BULK else INTERACTIVE_MAX_WAIT
+    waiting = False
+    try:
+        while True:
+            now = time.time()
+            budget, at = _pick(candidates, priority, now)
+            yield_to_interactive = priority == BULK and _interactive_waiting > 0
+            if at <= now and not yield_to_interactive:
+                break
+            if at - now > max_wait:
+                stats["rejected"] += 1
+                raise RateLimited(at - now)
+            if not waiting:
+                waiting = True
+                stats["delayed"] += 1
+                if priority == INTERACTIVE:
+                    _interactive_waiting += 1
+            await asyncio.sleep(min(max(at - now, 0.05), 1.0))
+    finally:
+        if waiting and priority == INTERACTIVE:
+            _interactive_waiting -= 1
+
+    stats["requests"] += 1
+    if budget.remaining is not None:
+        budget.remaining -= 1
+    return budget
+
+
+def record(budget: TokenBudget, resp: httpx.Response) -> bool:
+    """Update the token's budget from a response. Returns True if it was rate limited."""
+    headers = resp.headers
+    now = time.time()
+    if "x-ratelimit-remaining" in headers:
+        remaining = int(headers["x-ratelimit-remaining"])
+        reset_at = float(headers.get("x-ratelimit-reset", 0))
+        if reset_at != budget.reset_at or budget.remaining is None:
+            budget.remaining = remaining  # new window
+        else:
+            # Responses to concurrent calls can arrive out of order
+            budget.remaining = min(budget.remaining, remaining)
+        budget.reset_at = reset_at
+        if "x-ratelimit-limit" in headers:
+            budget.limit = int(headers["x-ratelimit-limit"])
+
+    if resp.status_code not in (403, 429):
+        return False
+    retry_after = headers.get("retry-after")
+    if retry_after is not None:
+        budget.blocked_until = now + float(retry_after)
+    elif headers.get("x-ratelimit-remaining") == "0":
+        budget.blocked_until = budget.reset_at
+    elif resp.status_code == 429 or b"rate limit" in resp.content[:512].lower():
+        budget.blocked_until = now + SECONDARY_LIMIT_SECONDS
+    else:
+        return False  # a plain 403: permissions, not rate limiting
+    stats["rate_limited"] += 1
+    return True
+
+
+def get_stats() -> dict:
+    now = time.time()
+    return {
+        **stats,
+        "interactive_waiting": _interactive_waiting,
+        "tokens": [
+            {
+                "token": b.label(),
+                "limit": b.limit,
+                "remaining": b.remaining,
+                "reset_in": max(0, round(b.reset_at - now)) if b.reset_at else None,
+                "blocked_for": max(0, round(b.blocked_until - now)),
+            }
+            for b in _pool
+        ],
+    }
@@ -2,13 +2,95 @@
 GitHub import service — fetches repo trees and files via REST API.
 Adapted from lms-platform with added branch listing support.
 """
+import asyncio
+import codecs
+import json
+import os
+import queue
 import re
-from typing import Optional
+import tarfile
+import time
+from typing import AsyncIterator, Callable, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+
 import httpx
 
-GITHUB_API = "https://api.github.com"
-GITHUB_RAW = "https://raw.githubusercontent.com"
+from . import file_service, github_cache, github_scheduler, html_rewriter, preview_cache
+
+# Overridable so a local fake GitHub can stand in during testing
+GITHUB_API = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_RAW = os.environ.get("GITHUB_RAW_URL", "https://raw.githubusercontent.com").rstrip("/")
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB per file
+IMPORT_MANIFEST_FILE = ".eduimport.json"  # optional import rules at the repo root
+COMMIT_SHA_RE = re.compile(r"[0-9a-f]{40}")
+
+# Import download fan-out: total in-flight requests, and a per-host cap. Raw
+# downloads all go to one host, so by default that cap is the total.
+IMPORT_CONCURRENCY = int(os.environ.get("GITHUB_IMPORT_CONCURRENCY", "8"))
+IMPORT_PER_HOST_CONCURRENCY = int(
+    os.environ.get("GITHUB_IMPORT_PER_HOST_CONCURRENCY", str(IMPORT_CONCURRENCY))
+)
+# Imports of at least this many files, making up at least this share of the
+# tree's bytes, come from a single tarball (which carries the whole tree)
+ARCHIVE_IMPORT_MIN_FILES = int(os.environ.get("GITHUB_ARCHIVE_IMPORT_MIN_FILES", "50"))
+ARCHIVE_IMPORT_MIN_SHARE = float(os.environ.get("GITHUB_ARCHIVE_IMPORT_MIN_SHARE", "0.5"))
+
+# Branch lists: GitHub's maximum page size, and a cap on pages fetched
+BRANCHES_PER_PAGE = 100
+MAX_BRANCH_PAGES = int(os.environ.get("GITHUB_MAX_BRANCH_PAGES", "50"))
+
+# Shared connection pool settings (see open_client)
+HTTP_TIMEOUT = float(os.environ.get("GITHUB_HTTP_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("GITHUB_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("GITHUB_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("GITHUB_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("GITHUB_HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.environ.get("GITHUB_HTTP2", "1") != "0"
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        follow_redirects=True,
+    )
+
+
+async def open_client() -> httpx.AsyncClient:
+    """Create the shared client. Called from the app lifespan on startup."""
+    return get_client()
+
+
+async def close_client() -> None:
+    """Close the shared client and its pooled connections on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    The shared pooled client. Created lazily when used outside the app
+    lifespan (scripts, the REPL).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
 
 
 def parse_github_url(url: str) -> tuple[str, str, str]:
@@ -28,106 +110,451 @@ def parse_github_url(url: str) -> tuple[str, str, str]:
     return owner, repo, branch
 
 
+def is_hidden(path: str) -> bool:
+    return path.startswith(".") or path.endswith((".gitignore", ".DS_Store"))
+
+
+async def _send(
+    url: str,
+    headers: Optional[dict] = None,
+    params: Optional[dict] = None,
+    token: Optional[str] = None,
+    stream: bool = False,
+) -> httpx.Response:
+    """
+    GET from GitHub. REST API calls are metered by github_scheduler, which
+    picks the token (from the pool unless `token` is given) and waits for,
+    or rotates away from, tokens that are rate limited. Raises
+    github_scheduler.RateLimited when no token has budget soon enough.
+    """
+    client = get_client()
+    headers = dict(headers or {})
+    if not url.startswith(GITHUB_API):
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        request = client.build_request("GET", url, headers=headers, params=params)
+        return await client.send(request, stream=stream)
+
+    while True:
+        budget = await github_scheduler.acquire(token)
+        if budget.token:
+            headers["Authorization"] = f"Bearer {budget.token}"
+        request = client.build_request("GET", url, headers=headers, params=params)
+        resp = await client.send(request, stream=stream)
+        if resp.status_code in (403, 429) and stream:
+            await resp.aread()  # the body tells a secondary limit from a permission error
+        if not github_scheduler.record(budget, resp):
+            return resp
+        await resp.aclose()
+
+
+async def _get_entry(
+    url: str,
+    token: Optional[str] = None,
+    params: Optional[dict] = None,
+    max_age: Optional[float] = None,
+) -> dict:
+    """GET a GitHub REST resource through the conditional-request cache."""
+    headers = {"Accept": "application/vnd.github+json"}
+
+    async def fetch(extra_headers: dict) -> httpx.Response:
+        return await _send(url, {**headers, **extra_headers}, params, token)
+
+    key = str(httpx.URL(url, params=params))
+    return await github_cache.get_entry(key, fetch, max_age=max_age, token=token)
+
+
+async def _get_json(
+    url: str,
+    token: Optional[str] = None,
+    params: Optional[dict] = None,
+    max_age: Optional[float] = None,
+):
+    return (await _get_entry(url, token, params, max_age))["body"]
+
+
+def _last_page(link: Optional[str]) -> int:
+    """Page count from a Link header (1 when there is no rel="last")."""
+    m = re.search(r'<([^>]+)>;\s*rel="last"', link or "")
+    if not m:
+        return 1
+    return int(parse_qs(urlsplit(m.group(1)).query).get("page", ["1"])[0])
+
+
 async def get_default_branch(
-    owner: str, repo: str, token: Optional[str] = None
+    owner: str, repo: str, token: Optional[str] = None, revalidate: bool = False
 ) -> str:
-    headers = {"Accept": "application/vnd.github+json"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    async with httpx.AsyncClient(timeout=15) as client:
-        resp = await client.get(f"{GITHUB_API}/repos/{owner}/{repo}", headers=headers)
-        resp.raise_for_status()
-        return resp.json()["default_branch"]
+    data = await _get_json(
+        f"{GITHUB_API}/repos/{owner}/{repo}", token, max_age=0 if revalidate else None
+    )
+    return data["default_branch"]
 
 
 async def list_branches(
     owner: str, repo: str, token: Optional[str] = None
 ) -> list[dict]:
-    """List all branches for a repo."""
-    headers = {"Accept": "application/vnd.github+json"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    async with httpx.AsyncClient(timeout=15) as client:
-        resp = await client.get(
-            f"{GITHUB_API}/repos/{owner}/{repo}/branches",
-            headers=headers,
-            params={"per_page": 100},
-        )
-        resp.raise_for_status()
-        return [{"name": b["name"]} for b in resp.json()]
+    """List all branches for a repo. Pages after the first are fetched in parallel."""
+    url = f"{GITHUB_API}/repos/{owner}/{repo}/branches"
+    first = await _get_entry(url, token, params={"per_page": BRANCHES_PER_PAGE})
+    pages = min(_last_page(first.get("link")), MAX_BRANCH_PAGES)
+    rest = await asyncio.gather(*(
+        _get_json(url, token, params={"per_page": BRANCHES_PER_PAGE, "page": page})
+        for page in range(2, pages + 1)
+    ))
+    return [{"name": b["name"]} for data in (first["body"], *rest) for b in data]
+
+
+async def resolve_commit(
+    owner: str, repo: str, branch: str, token: Optional[str] = None, revalidate: bool = False
+) -> str:
+    """SHA of the commit a branch currently points at."""
+    data = await _get_json(
+        f"{GITHUB_API}/repos/{owner}/{repo}/branches/{branch}", token, max_age=0 if revalidate else None
+    )
+    return data["commit"]["sha"]
 
 
 async def fetch_repo_files(
-    owner: str, repo: str, branch: str, token: Optional[str] = None
-) -> tuple[list[dict], str]:
+    owner: str,
+    repo: str,
+    branch: str,
+    token: Optional[str] = None,
+    revalidate: bool = False,
+) -> tuple[list[dict], str, str]:
     """
-    Returns (files_list, resolved_branch).
-    Each file dict has: path, size, download_url.
+    Returns (files_list, resolved_branch, commit_sha).
+    Each file dict has: path, size, sha (git blob SHA), download_url.
+    The tree and download URLs are pinned to the branch's current commit,
+    so a push while the files download can't mix two versions.
+    `branch` may also be a commit SHA.
+    revalidate=True skips the cache freshness window (used by imports).
     """
-    headers = {"Accept": "application/vnd.github+json"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-
     if not branch:
-        branch = await get_default_branch(owner, repo, token)
+        branch = await get_default_branch(owner, repo, token, revalidate)
+    if COMMIT_SHA_RE.fullmatch(branch):
+        commit = branch
+    else:
+        commit = await resolve_commit(owner, repo, branch, token, revalidate)
 
-    tree_url = f"{GITHUB_API}/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.get(tree_url, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
+    # A commit's tree never changes, so the cached copy is always good
+    tree_url = f"{GITHUB_API}/repos/{owner}/{repo}/git/trees/{commit}"
+    data = await _get_json(tree_url, token, params={"recursive": 1})
 
     files = []
     for item in data.get("tree", []):
         if item.get("type") != "blob":
             continue
         path = item["path"]
-        if path.startswith(".") or path.endswith((".gitignore", ".DS_Store")):
+        if is_hidden(path):
             continue
         files.append({
             "path": path,
             "size": item.get("size", 0),
-            "download_url": f"{GITHUB_RAW}/{owner}/{repo}/{branch}/{path}",
+            "sha": item.get("sha"),
+            "download_url": f"{GITHUB_RAW}/{owner}/{repo}/{commit}/{path}",
         })
-    return files, branch
+    return files, branch, commit
 
 
-async def download_file(url: str, token: Optional[str] = None) -> bytes:
-    headers = {}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.get(url, headers=headers)
+async def download_file(
+    url: str, token: Optional[str] = None, max_size: int = MAX_FILE_SIZE
+) -> bytes:
+    """Small files only: the body is read into memory, up to `max_size` bytes."""
+    resp = await _send(url, token=token, stream=True)
+    chunks, total = [], 0
+    try:
         resp.raise_for_status()
-        return resp.content
+        async for chunk in resp.aiter_bytes():
+            total += len(chunk)
+            if total > max_size:
+                raise ValueError(f"{url} is larger than {max_size} bytes")
+            chunks.append(chunk)
+    finally:
+        await resp.aclose()
+    return b"".join(chunks)
+
+
+async def fetch_import_manifest(
+    owner: str, repo: str, ref: str, token: Optional[str] = None
+) -> Optional[dict]:
+    """The repo's IMPORT_MANIFEST_FILE as JSON, or None if it has none."""
+    url = f"{GITHUB_RAW}/{owner}/{repo}/{ref}/{IMPORT_MANIFEST_FILE}"
+    try:
+        content = await download_file(url, token, max_size=64 * 1024)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            return None
+        raise
+    return json.loads(content)
+
+
+async def download_files(
+    files: list[dict],
+    on_saved: Optional[Callable[[dict, int], None]] = None,
+    token: Optional[str] = None,
+    concurrency: int = IMPORT_CONCURRENCY,
+    per_host: int = IMPORT_PER_HOST_CONCURRENCY,
+) -> dict:
+    """
+    Stream every file in `files` (as returned by fetch_repo_files) into the
+    blob store with at most `concurrency` requests in flight overall and
+    `per_host` per host, calling on_saved(file, size) as each one completes.
+    Files over MAX_FILE_SIZE are skipped.
+    Returns {"files", "bytes", "seconds"} for the whole batch.
+    """
+    files = [f for f in files if f.get("size", 0) <= MAX_FILE_SIZE]
+    limit = asyncio.Semaphore(max(1, concurrency))
+    host_limits: dict[str, asyncio.Semaphore] = {}
+    total_bytes = 0
+    started = time.perf_counter()
+
+    async def fetch(f: dict) -> None:
+        nonlocal total_bytes
+        host = urlsplit(f["download_url"]).netloc
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(max(1, per_host)))
+        async with host_limit, limit:
+            resp = await _send(f["download_url"], token=token, stream=True)
+            try:
+                resp.raise_for_status()
+                size = await file_service.write_blob(f["sha"], f["size"], resp.aiter_bytes())
+            finally:
+                await resp.aclose()
+        total_bytes += size
+        if on_saved:
+            on_saved(f, size)
+
+    tasks = [asyncio.create_task(fetch(f)) for f in files]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return {
+        "files": len(files),
+        "bytes": total_bytes,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+class _ChunkReader:
+    """Blocking file-like view over a queue of byte chunks, for tarfile stream mode."""
+
+    def __init__(self, chunks: "queue.Queue"):
+        self._chunks = chunks
+        self._buffer = b""
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._chunks.get()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _extract_archive(
+    reader: _ChunkReader, wanted: dict[str, dict], on_saved: Optional[Callable[[dict, int], None]]
+) -> tuple[set[str], int]:
+    saved: set[str] = set()
+    total_bytes = 0
+    with tarfile.open(fileobj=reader, mode="r|gz") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            # GitHub prefixes every entry with "{owner}-{repo}-{sha}/"
+            _, _, path = member.name.partition("/")
+            f = wanted.get(path)
+            if f is None or member.size > MAX_FILE_SIZE:
+                continue
+            try:
+                size = file_service.copy_blob(f["sha"], f["size"], archive.extractfile(member))
+            except file_service.BlobMismatch:
+                continue  # fetch it individually
+            saved.add(path)
+            total_bytes += size
+            if on_saved:
+                on_saved(f, size)
+    # Drain the rest of the stream so the producer never blocks on a full queue
+    while reader.read(64 * 1024):
+        pass
+    return saved, total_bytes
+
+
+async def download_archive(
+    owner: str,
+    repo: str,
+    ref: str,
+    files: list[dict],
+    on_saved: Optional[Callable[[dict, int], None]] = None,
+    token: Optional[str] = None,
+) -> dict:
+    """
+    Download the branch tarball in one request and extract the entries
+    listed in `files` into the blob store while it streams in, calling
+    on_saved(file, size) for each (from a worker thread). Files missing
+    from the archive are fetched individually.
+    Returns {"files", "bytes", "seconds"} like download_files.
+    """
+    started = time.perf_counter()
+    wanted = {f["path"]: f for f in files if f.get("size", 0) <= MAX_FILE_SIZE}
+    chunks: queue.Queue = queue.Queue(maxsize=32)
+    extractor = asyncio.create_task(
+        asyncio.to_thread(_extract_archive, _ChunkReader(chunks), wanted, on_saved)
+    )
+
+    async def put(item) -> None:
+        # Backpressure without parking a thread: wait while the extractor catches up
+        while not extractor.done():
+            try:
+                chunks.put_nowait(item)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.005)
+
+    try:
+        resp = await _send(
+            f"{GITHUB_API}/repos/{owner}/{repo}/tarball/{ref}",
+            {"Accept": "application/vnd.github+json"},
+            token=token,
+            stream=True,
+        )
+        try:
+            resp.raise_for_status()
+            async for chunk in resp.aiter_bytes():
+                if extractor.done():
+                    break
+                await put(chunk)
+        finally:
+            await resp.aclose()
+        await put(None)
+    except BaseException as e:
+        await put(e if isinstance(e, Exception) else None)
+        await asyncio.gather(extractor, return_exceptions=True)
+        raise
+    saved, total_bytes = await extractor
+
+    missing = [f for path, f in wanted.items() if path not in saved]
+    if missing:
+        total_bytes += (await download_files(missing, on_saved, token))["bytes"]
+
+    return {
+        "files": len(wanted),
+        "bytes": total_bytes,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def import_files(
+    owner: str,
+    repo: str,
+    ref: str,
+    files: list[dict],
+    on_saved: Optional[Callable[[dict, int], None]] = None,
+    token: Optional[str] = None,
+    tree_bytes: Optional[int] = None,
+) -> dict:
+    """
+    Download `files` into the blob store, using the tarball when many
+    files are wanted and they make up most of the tree's `tree_bytes`
+    (so excluded or unchanged content isn't downloaded with them), and
+    per-file requests otherwise (or when the archive fails).
+    The returned stats include the "mode" that was used.
+    """
+    wanted_bytes = sum(f.get("size", 0) for f in files)
+    if tree_bytes is None:
+        tree_bytes = wanted_bytes
+    if len(files) >= ARCHIVE_IMPORT_MIN_FILES and wanted_bytes >= ARCHIVE_IMPORT_MIN_SHARE * tree_bytes:
+        try:
+            stats = await download_archive(owner, repo, ref, files, on_saved, token)
+            return {**stats, "mode": "archive"}
+        except (httpx.HTTPError, tarfile.TarError, github_scheduler.RateLimited):
+            pass  # raw file downloads don't count against the API rate limit
+    stats = await download_files(files, on_saved, token)
+    return {**stats, "mode": "files"}
 
 
-async def fetch_and_rewrite_html(
-    owner: str, repo: str, branch: str, token: Optional[str] = None
-) -> Optional[str]:
+async def stream_rewritten_html(
+    owner: str,
+    repo: str,
+    branch: str,
+    token: Optional[str] = None,
+    stylesheet_proxy: Optional[str] = None,
+) -> Optional[AsyncIterator[str]]:
     """
-    Fetch the entry HTML from a branch, rewrite relative URLs to point
-    to raw.githubusercontent.com so assets load in an iframe.
+    Stream the entry HTML of a branch with relative URLs rewritten to
+    raw.githubusercontent.com so assets load in an iframe (see
+    html_rewriter). Linked stylesheets are pointed at `stylesheet_proxy`,
+    when given, so their own url() references get rewritten as well.
+    Returns None if the branch has no HTML file.
+    The branch is pinned to its current commit and the rewritten document
+    is cached per commit, so repeat views don't download it again.
     """
-    files, branch = await fetch_repo_files(owner, repo, branch, token)
+    if not branch:
+        branch = await get_default_branch(owner, repo, token)
+    files, _, commit = await fetch_repo_files(owner, repo, branch, token)
     file_paths = [f["path"] for f in files]
     entry = detect_entry_file(file_paths)
     if not entry:
         return None
 
-    entry_url = f"{GITHUB_RAW}/{owner}/{repo}/{branch}/{entry}"
-    html_bytes = await download_file(entry_url, token)
-    html = html_bytes.decode("utf-8", errors="replace")
-
-    # Rewrite relative URLs to absolute raw.githubusercontent.com paths
-    base_url = f"{GITHUB_RAW}/{owner}/{repo}/{branch}/"
-    # Handle src="...", href="...", url(...) but skip absolute URLs and data: URIs
-    html = re.sub(
-        r'(src|href)="(?!https?://|data:|#|mailto:)([^"]+)"',
-        lambda m: f'{m.group(1)}="{base_url}{m.group(2)}"',
-        html,
+    cached = await preview_cache.get(owner, repo, commit, entry, stylesheet_proxy or "")
+    if cached is not None:
+        async def replay() -> AsyncIterator[str]:
+            yield cached
+        return replay()
+
+    root_url = f"{GITHUB_RAW}/{owner}/{repo}/{commit}/"
+    resp = await _send(root_url + entry, token=token, stream=True)
+    if resp.is_error:
+        await resp.aclose()
+        resp.raise_for_status()
+
+    def stylesheet_url(url: str) -> str:
+        if not url.startswith(root_url):
+            return url
+        query = urlencode({"owner": owner, "repo": repo, "ref": commit, "path": url[len(root_url):]})
+        return f"{stylesheet_proxy}?{query}".replace("&", "&amp;")
+
+    rewriter = html_rewriter.HtmlUrlRewriter(
+        root_url + entry, root_url, stylesheet_url if stylesheet_proxy else None
     )
-    return html
+
+    async def generate() -> AsyncIterator[str]:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        parts = []
+        try:
+            async for chunk in resp.aiter_bytes():
+                out = rewriter.feed(decoder.decode(chunk))
+                if out:
+                    parts.append(out)
+                    yield out
+            out = rewriter.feed(decoder.decode(b"", final=True)) + rewriter.close()
+            parts.append(out)
+            yield out
+        finally:
+            await resp.aclose()
+        # Only complete documents are cached (not ones cut off by a disconnect)
+        await preview_cache.put(owner, repo, commit, entry, "".join(parts), stylesheet_proxy or "")
+
+    return generate()
+
+
+async def fetch_rewritten_css(
+    owner: str, repo: str, ref: str, path: str, token: Optional[str] = None
+) -> str:
+    """A stylesheet from the repo with its url()/@import references made absolute."""
+    root_url = f"{GITHUB_RAW}/{owner}/{repo}/{ref}/"
+    css = (await download_file(root_url + path, token)).decode("utf-8", errors="replace")
+    return html_rewriter.rewrite_css(css, html_rewriter.UrlResolver(root_url + path, root_url))
 
 
 def detect_entry_file(file_paths: list[str]) -> Optional[str]:
@@ -0,0 +1,275 @@
+"""
+Streaming URL rewriter for branch previews.
+
+HtmlUrlRewriter is a small single-pass tokenizer: feed() it decoded chunks
+as they arrive and it returns the rewritten output that is safe to emit
+so far, holding back only an unfinished tag (or <style> block). Relative
+URLs are resolved against the document URL (or its <base href>) in:
+  - src, href, poster, background, data, srcset attributes, any quoting
+  - inline style="..." url(...) values and <style> blocks (url(), @import)
+Script, textarea and title contents and comments are passed through.
+Linked stylesheets can be routed through `stylesheet_url` so their own
+url() references get rewritten too (see rewrite_css).
+
+Text, closing tags and tags with nothing to rewrite are passed over by one
+regex scan (_SKIP_RE), so prose-heavy pages rewrite at close to regex
+speed. Each tag holding a relative URL still costs a Python-level
+attribute parse: on markup where nearly every tag has one, this runs
+several times slower than a single re.sub over src/href would (see
+scripts/bench_rewriter.py). That is the price of the wider coverage;
+previews are rewritten once per commit and then served from preview_cache.
+"""
+import re
+from typing import Callable, Optional
+from urllib.parse import urljoin
+
+URL_ATTRS = {"src", "href", "poster", "background", "data"}
+RAW_TEXT_TAGS = {"script", "style", "textarea", "title"}
+MAX_PENDING = 1024 * 1024  # give up on a tag that never closes; emit it verbatim
+
+_SCHEME_RE = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:")
+# Rest of a tag up to its '>': quoted values may contain '>', stray quotes are plain text.
+# An unterminated quoted value doesn't match, so the caller waits for more input.
+_TAG_REST = r"""(?:[^>"'=]++|=\s*+"[^"]*+"|=\s*+'[^']*+'|=(?!\s*+["'])|["'])*+>"""
+# "<!--", "<!..."/"<?...", or an opening/closing tag, with its rest when complete
+_MARKUP_RE = re.compile(rf"<(?:(!--)|([!?])|(/?)([a-zA-Z][a-zA-Z0-9:-]*+)({_TAG_REST})?)")
+_ATTR_RE = re.compile(
+    r"""([^\s"'>/=]+)(?:(\s*=\s*)(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?"""
+)
+# Quotes may be entity-encoded when the CSS sits in a style="..." attribute
+_CSS_URL_RE = re.compile(
+    r"""(url\(\s*)(["']|&quot;|&#39;|&apos;|)([^"')]*?)(\2\s*\))""", re.IGNORECASE
+)
+_CSS_IMPORT_RE = re.compile(r"""(@import\s+)(["'])([^"']*)(\2)""", re.IGNORECASE)
+_SRCSET_RE = re.compile(r"(\s*)([^\s,]+)([^,]*)")
+# Cheap pre-check so tags without URL-bearing attributes skip attribute parsing
+_URL_ATTR_HINT_RE = re.compile(r"(?:src|srcset|href|poster|background|data|style)\s*=", re.IGNORECASE)
+# A URL-bearing attribute whose value might need rewriting: srcset and
+# style always, the others unless the value is plainly not relative
+_REWRITABLE_ATTR = (
+    r"""(?:srcset|style)\s*=|(?:src|href|poster|background|data)\s*=\s*+"""
+    r"""(?!["']?\s*+(?:\#|//|\{\{|[a-zA-Z][a-zA-Z0-9+.-]*:))"""
+)
+# Everything before the next markup the tokenizer has to look at, in one
+# scan: text, a "<" that starts no markup, closing tags, and complete
+# opening tags that have nothing to rewrite and don't start raw text or
+# set the <base>. A "<" at the very end may be split markup, so it stops there.
+_SKIP_RE = re.compile(
+    rf"""(?:[^<]++
+      |<(?=[^a-zA-Z!?/])|</(?=[^a-zA-Z])
+      |</[a-zA-Z]{_TAG_REST}
+      |<(?!(?:base|{"|".join(RAW_TEXT_TAGS)})[^a-zA-Z0-9:-])[a-zA-Z]
+        (?:(?!{_REWRITABLE_ATTR})[^\s"'>/=]++|[\s/]++|=\s*+"[^"]*+"|=\s*+'[^']*+'|=(?!\s*+["'])|["'])*+>
+    )*+""",
+    re.IGNORECASE | re.VERBOSE,
+)
+# Attributes _rewrite_tag reads; the rest are skipped as they are parsed
+_REWRITTEN_ATTRS = URL_ATTRS | {"srcset", "style", "rel"}
+_RAW_TEXT_END_RE = {tag: re.compile(f"</{tag}", re.IGNORECASE) for tag in RAW_TEXT_TAGS}
+
+
+def _is_relative(url: str) -> bool:
+    url = url.strip()
+    return bool(url) and not (
+        url.startswith(("#", "//", "{{")) or _SCHEME_RE.match(url)
+    )
+
+
+class UrlResolver:
+    """Resolves document-relative URLs; root-relative ones map to `root_url`."""
+
+    def __init__(self, document_url: str, root_url: str):
+        self.root = root_url
+        self.base = document_url
+
+    @property
+    def base(self) -> str:
+        return self._base
+
+    @base.setter
+    def base(self, url: str) -> None:
+        self._base = url
+        self._base_dir = url[:url.rfind("/") + 1]
+
+    def __call__(self, url: str) -> str:
+        stripped = url.strip()
+        if not stripped or stripped.startswith(("#", "//", "{{")) or _SCHEME_RE.match(stripped):
+            return url
+        url = stripped
+        if url.startswith("/"):
+            return self.root + url.lstrip("/")
+        if url.startswith((".", "?")) or "/." in url:
+            return urljoin(self._base, url)
+        return self._base_dir + url  # plain "dir/file" paths: skip urljoin
+
+
+def rewrite_css(css: str, resolve: Callable[[str], str]) -> str:
+    css = _CSS_URL_RE.sub(lambda m: m.group(1) + m.group(2) + resolve(m.group(3)) + m.group(4), css)
+    return _CSS_IMPORT_RE.sub(lambda m: m.group(1) + m.group(2) + resolve(m.group(3)) + m.group(4), css)
+
+
+def _rewrite_srcset(value: str, resolve: Callable[[str], str]) -> str:
+    return _SRCSET_RE.sub(lambda m: m.group(1) + resolve(m.group(2)) + m.group(3), value)
+
+
+class HtmlUrlRewriter:
+    def __init__(
+        self,
+        document_url: str,
+        root_url: str,
+        stylesheet_url: Optional[Callable[[str], str]] = None,
+    ):
+        self.resolve = UrlResolver(document_url, root_url)
+        self.stylesheet_url = stylesheet_url
+        self._buffer = ""
+        self._raw_tag: Optional[str] = None  # inside <script>/<style>/...
+        self._in_comment = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        return self._drain(final=False)
+
+    def close(self) -> str:
+        return self._drain(final=True)
+
+    def rewrite(self, html: str) -> str:
+        """Rewrite a complete document in one call."""
+        return self.feed(html) + self.close()
+
+    # -- tokenizer ---------------------------------------------------------
+
+    def _drain(self, final: bool) -> str:
+        buf = self._buffer
+        n = len(buf)
+        out: list[str] = []
+        i = 0
+        flushed = 0  # buf[flushed:i] is unchanged input not yet copied to `out`
+        while i < n:
+            if self._in_comment:
+                end = buf.find("-->", i)
+                if end < 0:
+                    i = n if final else max(i, n - 2)
+                    break
+                i = end + 3
+                self._in_comment = False
+                continue
+
+            if self._raw_tag is not None:
+                m = _RAW_TEXT_END_RE[self._raw_tag].search(buf, i)
+                if self._raw_tag == "style":
+                    # Style blocks are rewritten as a whole, so wait for the end tag
+                    if m is None:
+                        if final:
+                            out.append(buf[flushed:i])
+                            out.append(rewrite_css(buf[i:], self.resolve))
+                            i = flushed = n
+                        break
+                    out.append(buf[flushed:i])
+                    out.append(rewrite_css(buf[i:m.start()], self.resolve))
+                    flushed = m.start()
+                elif m is None:
+                    # hold back a possibly split "</script"
+                    i = n if final else max(i, n - len(self._raw_tag) - 2)
+                    break
+                i = m.start()
+                self._raw_tag = None
+                continue
+
+            i = _SKIP_RE.match(buf, i).end()
+            m = _MARKUP_RE.match(buf, i)
+            if m is None:
+                # hold back a "<", "</" or "<!-" split across chunks
+                tail = -1 if final else buf.rfind("<", max(i, n - 3))
+                i = n if tail < 0 else tail
+                break
+            if m.group(1):  # <!--
+                i = m.end()
+                self._in_comment = True
+                continue
+            if m.group(2):  # <!DOCTYPE ...>, <?...>
+                end = buf.find(">", i)
+                if end < 0:
+                    if final:
+                        i = n
+                    break
+                i = end + 1
+                continue
+            if m.group(5) is None:  # the tag isn't complete yet
+                if final or n - i > MAX_PENDING:
+                    i = n
+                break
+            end = m.end()
+            if not m.group(3):  # opening tag
+                name = m.group(4).lower()
+                if _URL_ATTR_HINT_RE.search(buf, i, end):
+                    tag = buf[i:end]
+                    rewritten = self._rewrite_tag(name, tag, m.end(4) - i)
+                    if rewritten is not tag:
+                        out.append(buf[flushed:i])
+                        out.append(rewritten)
+                        flushed = end
+                if name in RAW_TEXT_TAGS and buf[end - 2] != "/":
+                    self._raw_tag = name
+            i = end
+
+        out.append(buf[flushed:i])
+        self._buffer = buf[i:]
+        return "".join(out)
+
+    def _rewrite_tag(self, name: str, tag: str, attrs_start: int) -> str:
+        """`tag` with its URLs rewritten, or `tag` itself when none change."""
+        attrs: dict = {}
+        for m in _ATTR_RE.finditer(tag, attrs_start, len(tag) - 1):
+            attr = m.group(1).lower()
+            if attr in _REWRITTEN_ATTRS and attr not in attrs:  # first occurrence wins, as in browsers
+                attrs[attr] = m
+        if not attrs:
+            return tag
+
+        new_base = None
+        if name == "base" and "href" in attrs:
+            new_base = self.resolve(self._value(attrs["href"]))
+
+        stylesheet = (
+            name == "link"
+            and self.stylesheet_url is not None
+            and "stylesheet" in self._value(attrs.get("rel")).lower().split()
+        )
+
+        # attrs is in document order, so the new tag is built left to right
+        parts = []
+        last = 0
+        for attr, m in attrs.items():
+            value_group = m.lastindex  # 3, 4 or 5 (by quoting) when there is a value
+            if value_group < 3:
+                continue
+            value = m.group(value_group)
+            if attr in URL_ATTRS:
+                new = self.resolve(value)
+                if stylesheet and attr == "href" and _is_relative(value):
+                    new = self.stylesheet_url(new)
+            elif attr == "srcset":
+                new = _rewrite_srcset(value, self.resolve)
+            elif attr == "style":
+                new = rewrite_css(value, self.resolve)
+            else:
+                continue
+            if new == value:
+                continue
+            start, end = m.span(value_group)
+            parts.append(tag[last:start])
+            parts.append(f'"{new}"' if value_group == 5 else new)
+            last = end
+
+        if new_base is not None:
+            self.resolve.base = new_base  # applies to every URL after <base>
+        if not parts:
+            return tag
+        parts.append(tag[last:])
+        return "".join(parts)
+
+    @staticmethod
+    def _value(m) -> str:
+        if m is None:
+            return ""
+        return next((v for v in m.group(3, 4, 5) if v is not None), "")
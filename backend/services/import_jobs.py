@@ -0,0 +1,193 @@
+"""
+Background queue for GitHub imports and re-syncs.
+
+Jobs live in the ImportJob table, so they survive a restart: workers
+started from the app lifespan claim queued jobs with a conditional
+UPDATE, and jobs left "running" by a process that died are queued again
+on startup (this assumes one app process per database, as deployed).
+Transient failures (network errors, 5xx, GitHub rate limits, content
+that changed while it downloaded) are retried with exponential backoff
+up to MAX_ATTEMPTS; anything else fails the job straight away.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+from sqlmodel import Session, select, update
+
+from ..database import engine
+from ..models.assignment import Assignment
+from ..models.import_job import ImportJob
+from . import file_service, github_scheduler, import_service, serve_cache
+
+WORKERS = int(os.environ.get("IMPORT_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.environ.get("IMPORT_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.environ.get("IMPORT_RETRY_BASE_SECONDS", "5"))
+RETRY_MAX_SECONDS = float(os.environ.get("IMPORT_RETRY_MAX_SECONDS", "600"))
+POLL_SECONDS = 2.0  # how often idle workers look for retries that became due
+PROGRESS_INTERVAL = 1.0  # how often running jobs write progress to the database
+
+_workers: list[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+
+
+def enqueue(
+    session: Session, kind: str, assignment_id: int, user_id: Optional[int]
+) -> ImportJob:
+    job = ImportJob(kind=kind, assignment_id=assignment_id, created_by_id=user_id)
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    if _wakeup is not None:
+        _wakeup.set()
+    return job
+
+
+def active_job(session: Session, assignment_id: int) -> Optional[ImportJob]:
+    """The queued or running job for an assignment, if there is one."""
+    return session.exec(
+        select(ImportJob).where(
+            ImportJob.assignment_id == assignment_id,
+            ImportJob.status.in_(("queued", "running")),
+        )
+    ).first()
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        status = e.response.status_code
+        return status == 429 or status >= 500
+    # A mismatch means the listing was out of date; the retry lists the tree again
+    return isinstance(e, (github_scheduler.RateLimited, httpx.TransportError, OSError, file_service.BlobMismatch))
+
+
+def _claim_next() -> Optional[int]:
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        job = session.exec(
+            select(ImportJob)
+            .where(ImportJob.status == "queued", ImportJob.next_attempt_at <= now)
+            .order_by(ImportJob.next_attempt_at)
+        ).first()
+        if job is None:
+            return None
+        result = session.exec(
+            update(ImportJob)
+            .where(ImportJob.id == job.id, ImportJob.status == "queued")
+            .values(status="running", attempts=ImportJob.attempts + 1, updated_at=now)
+        )
+        session.commit()
+        return job.id if result.rowcount else None
+
+
+async def _write_progress(job_id: int, progress: dict) -> None:
+    written = None
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        current = dict(progress)
+        if current == written:
+            continue
+        with Session(engine) as session:
+            session.exec(
+                update(ImportJob)
+                .where(ImportJob.id == job_id)
+                .values(**current, updated_at=datetime.utcnow())
+            )
+            session.commit()
+        written = current
+
+
+async def _run(job_id: int) -> None:
+    with Session(engine) as session:
+        job = session.get(ImportJob, job_id)
+        assignment = session.get(Assignment, job.assignment_id)
+        progress = {"files_done": 0, "files_total": 0, "bytes_done": 0}
+
+        def on_progress(files_done: int, files_total: int, bytes_done: int) -> None:
+            progress.update(files_done=files_done, files_total=files_total, bytes_done=bytes_done)
+
+        writer = asyncio.create_task(_write_progress(job_id, progress))
+        try:
+            if assignment is None or assignment.deleted_at:
+                raise LookupError("Assignment no longer exists")
+            # Imports yield GitHub API budget to interactive requests
+            with github_scheduler.bulk():
+                stats = await import_service.sync_assignment(session, assignment, on_progress)
+        except Exception as e:
+            session.rollback()
+            job.error = f"{type(e).__name__}: {e}"
+            if _is_retryable(e) and job.attempts < MAX_ATTEMPTS:
+                delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+                if isinstance(e, github_scheduler.RateLimited):
+                    delay = max(delay, e.retry_after)
+                job.status = "queued"
+                job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            else:
+                job.status = "failed"
+                job.finished_at = datetime.utcnow()
+                if job.kind == "import" and assignment is not None:
+                    # Nothing was imported; don't leave an empty, unpublished assignment
+                    # (the garbage collector removes it and anything stored so far)
+                    assignment.deleted_at = assignment.deleted_at or datetime.utcnow()
+                    session.add(assignment)
+                    job.assignment_id = None
+        else:
+            if job.kind == "import":
+                assignment.is_published = True
+                session.add(assignment)
+            job.status = "done"
+            job.error = None
+            job.result = stats
+            job.finished_at = datetime.utcnow()
+        finally:
+            writer.cancel()
+
+        job.files_done = progress["files_done"]
+        job.files_total = progress["files_total"]
+        job.bytes_done = progress["bytes_done"]
+        job.updated_at = datetime.utcnow()
+        session.add(job)
+        session.commit()
+        if assignment is not None and job.kind == "import" and job.status in ("done", "failed"):
+            # After the commit that publishes (or deletes) it, so no 404 cached before lingers
+            serve_cache.invalidate(assignment.id)
+
+
+async def _worker() -> None:
+    while True:
+        _wakeup.clear()
+        job_id = _claim_next()
+        if job_id is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _run(job_id)
+        except Exception:
+            pass  # bookkeeping failed; the job is requeued on the next start()
+
+
+async def start() -> None:
+    """Requeue jobs interrupted by a restart and start the worker tasks."""
+    global _wakeup
+    with Session(engine) as session:
+        session.exec(
+            update(ImportJob)
+            .where(ImportJob.status == "running")
+            .values(status="queued", next_attempt_at=datetime.utcnow())
+        )
+        session.commit()
+    _wakeup = asyncio.Event()
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(max(1, WORKERS)))
+
+
+async def stop() -> None:
+    """Cancel the workers; a job cut off mid-run is picked up again on the next start()."""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -0,0 +1,180 @@
+"""
+Brings an assignment's stored files in line with a GitHub tree listing.
+Shared by the initial import and re-sync: only blobs missing from the
+store are downloaded, and blobs the assignment no longer uses are released.
+An ImportManifest (from the import request or the repo's .eduimport.json)
+narrows the listing before anything is downloaded.
+"""
+import asyncio
+from collections import Counter
+from datetime import datetime
+from fnmatch import fnmatchcase
+from typing import Callable, Optional
+
+from sqlmodel import Session
+
+from ..models.assignment import Assignment, ImportManifest
+from . import file_service, github_service, serve_cache
+
+SKIPPED_REPORT_LIMIT = 100  # paths listed in the "skipped" report; the rest are only counted
+
+
+def _matches(path: str, pattern: str) -> bool:
+    pattern = pattern.strip("/")
+    if "/" not in pattern:
+        return any(fnmatchcase(part, pattern) for part in path.split("/"))
+    return fnmatchcase(path, pattern) or fnmatchcase(path, pattern + "/*")
+
+
+def select_files(
+    files: list[dict], rules: Optional[ImportManifest]
+) -> tuple[list[dict], list[dict]]:
+    """
+    Apply MAX_FILE_SIZE and the manifest's globs and limits to a tree
+    listing. Returns (kept, skipped); skipped entries have a "reason".
+    Under a byte or file budget the entry HTML goes first, then other
+    HTML, then the smallest files, so one large dataset can't crowd out
+    the page's own assets.
+    """
+    kept, skipped = [], []
+    for f in files:
+        path = f["path"]
+        if f["size"] > github_service.MAX_FILE_SIZE:
+            reason = "too_large"
+        elif rules and rules.include and not any(_matches(path, p) for p in rules.include):
+            reason = "not_included"
+        elif rules and any(_matches(path, p) for p in rules.exclude):
+            reason = "excluded"
+        else:
+            kept.append(f)
+            continue
+        skipped.append({**f, "reason": reason})
+
+    if rules and (rules.max_bytes is not None or rules.max_files is not None):
+        entry = github_service.detect_entry_file([f["path"] for f in kept])
+        ordered = sorted(kept, key=lambda f: (
+            f["path"] != entry, not f["path"].endswith(".html"), f["size"], f["path"]
+        ))
+        kept, total = [], 0
+        for f in ordered:
+            if rules.max_files is not None and len(kept) >= rules.max_files:
+                skipped.append({**f, "reason": "file_limit"})
+            elif rules.max_bytes is not None and total + f["size"] > rules.max_bytes:
+                skipped.append({**f, "reason": "byte_budget"})
+            else:
+                kept.append(f)
+                total += f["size"]
+    return kept, skipped
+
+
+def _skipped_report(skipped: list[dict]) -> dict:
+    largest = sorted(skipped, key=lambda f: -f["size"])[:SKIPPED_REPORT_LIMIT]
+    return {
+        "files": len(skipped),
+        "bytes": sum(f["size"] for f in skipped),
+        "reasons": dict(Counter(f["reason"] for f in skipped)),
+        "paths": [{"path": f["path"], "size": f["size"], "reason": f["reason"]} for f in largest],
+    }
+
+
+async def store_tree(
+    session: Session,
+    assignment_id: int,
+    owner: str,
+    repo: str,
+    ref: str,
+    files: list[dict],
+    progress: Optional[Callable[[int, int, int], None]] = None,
+    tree_bytes: Optional[int] = None,
+) -> dict:
+    """
+    Download what's needed for `files` and replace the assignment's manifest.
+    `tree_bytes` is the size of the whole tree `files` were selected from.
+    progress(files_done, files_total, bytes_done) is called after each
+    download (possibly from a worker thread, so it shouldn't block).
+    Returns the download and precompression stats plus
+    files/reused/changed/removed counts.
+    """
+    # Storage calls may be network round trips (S3), so they run off the event loop
+    old = await asyncio.to_thread(file_service.read_manifest, assignment_id) or {}
+    manifest = {f["path"]: f["sha"] for f in files}
+    old_shas, new_shas = set(old.values()), set(manifest.values())
+
+    # Reference the blobs already stored first, so a concurrent delete can't
+    # free one we reuse. The Blob table says which those are (rows are only
+    # added once a blob is stored), so only the rest are downloaded.
+    added = {f["sha"]: f["size"] for f in files if f["sha"] not in old_shas}
+    stored = file_service.take_stored_blob_refs(session, set(added))
+    missing = list({f["sha"]: f for f in files if f["sha"] in added.keys() - stored}.values())
+    done = {"files": 0, "bytes": 0}
+
+    def on_saved(f: dict, size: int) -> None:
+        done["files"] += 1
+        done["bytes"] += size
+        if progress:
+            progress(done["files"], len(missing), done["bytes"])
+
+    if progress:
+        progress(0, len(missing), 0)
+    try:
+        stats = await github_service.import_files(
+            owner, repo, ref, missing, on_saved, tree_bytes=tree_bytes
+        )
+    except Exception:
+        # Blobs stored before the failure have no row; the orphan sweep removes
+        # them once no import is in progress
+        await asyncio.to_thread(file_service.release_blob_refs, session, stored)
+        raise
+    file_service.add_blob_refs(session, {sha: added[sha] for sha in added.keys() - stored})
+
+    await asyncio.to_thread(file_service.write_manifest, assignment_id, manifest)
+    await asyncio.to_thread(file_service.release_blob_refs, session, old_shas - new_shas)
+    await asyncio.to_thread(file_service.delete_legacy_files, assignment_id)
+    stats.update(await asyncio.to_thread(file_service.precompress_blobs, manifest))
+
+    return {
+        **stats,
+        "files": len(files),
+        "reused": len(files) - len(missing),
+        "changed": sum(1 for path, sha in manifest.items() if old.get(path) != sha),
+        "removed": len(old.keys() - manifest.keys()),
+    }
+
+
+async def sync_assignment(
+    session: Session,
+    assignment: Assignment,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+) -> dict:
+    """
+    Fetch the tree for the assignment's GitHub URL and branch (auto-detected
+    when empty), select files with the import manifest, store them, and
+    update the branch and entry file. The manifest sent with the import
+    request takes precedence over one in the repo.
+    Returns the store_tree stats plus a "skipped" report.
+    """
+    owner, repo, _ = github_service.parse_github_url(assignment.github_url)
+    listed, resolved_branch, commit = await github_service.fetch_repo_files(
+        owner, repo, assignment.github_branch or "", revalidate=True
+    )
+    rules = await asyncio.to_thread(file_service.read_import_manifest, assignment.id)
+    if rules is None:
+        rules = await github_service.fetch_import_manifest(owner, repo, commit)
+    manifest = ImportManifest.model_validate(rules) if rules is not None else None
+
+    files, skipped = select_files(listed, manifest)
+    stats = await store_tree(
+        session, assignment.id, owner, repo, commit, files, progress,
+        tree_bytes=sum(f["size"] for f in listed),
+    )
+    stats["skipped"] = _skipped_report(skipped)
+
+    assignment.github_branch = resolved_branch
+    assignment.file_path = github_service.detect_entry_file([f["path"] for f in files])
+    assignment.updated_at = datetime.utcnow()
+    session.add(assignment)
+    session.commit()
+    # Only now: a /serve in between would cache the old entry under the new generation
+    serve_cache.invalidate(assignment.id)
+    session.refresh(assignment)
+    return stats
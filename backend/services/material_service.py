@@ -0,0 +1,232 @@
+"""
+Storage for uploaded supplementary materials.
+
+Uploads are stored by content in the shared blob store
+(file_service.py): SupplementaryMaterial.file_path is "blobs/{sha[:2]}/{sha}"
+(a storage key), content_hash is the git blob SHA and each material
+holds one Blob reference, so a file attached to many assignments is
+kept once and removed with its last reference. Uploads from before the
+blob store have file_path "{assignment_id}/{material_id}_{filename}",
+stored under "materials/".
+
+Uploads are copied into local scratch space (storage/tmp/uploads/, with
+resumable uploads in {upload_id}.part, see upload_sessions.py) in
+chunks, hashed as they are written and abandoned as soon as they pass
+the size limit; only complete files are put into the store.
+"""
+import asyncio
+import contextlib
+import os
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+from sqlmodel import Session, func, select
+
+from ..models.blob import Blob
+from ..models.supplementary_material import SupplementaryMaterial
+from . import file_service, storage
+
+TMP_DIR = file_service.TMP_DIR / "uploads"
+MAX_FILE_SIZE = 20 * 1024 * 1024  # 20 MB
+MAX_FORM_FIELD_BYTES = 64 * 1024  # the text fields sent along with an upload, together
+MAX_FORM_OVERHEAD = MAX_FORM_FIELD_BYTES + 16 * 1024  # fields, part headers and boundaries
+CHUNK_SIZE = 64 * 1024
+BLOB_PREFIX = "blobs/"
+LEGACY_PREFIX = "materials/"
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds {max_size // (1024 * 1024)} MB limit")
+        self.max_size = max_size
+
+
+class StagedUpload:
+    """A fully received upload in TMP_DIR, not yet moved into place."""
+
+    def __init__(self, path: Path, size: int, sha: str):
+        self.path = path
+        self.size = size
+        self.sha = sha  # git blob SHA
+
+
+def blob_file_path(sha: str) -> str:
+    """SupplementaryMaterial.file_path of the blob `sha`."""
+    return file_service.blob_key(sha)
+
+
+def material_key(file_path: str) -> str:
+    """Storage key of the material stored as `file_path`."""
+    if file_path.startswith(BLOB_PREFIX):
+        return file_path
+    return LEGACY_PREFIX + file_path
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """The last component of a client-supplied filename."""
+    name = Path((filename or "").replace("\\", "/")).name
+    return name or "upload"
+
+
+def hash_file(path: Path, size: int) -> str:
+    """Git blob SHA of a `size`-byte file (blocking)."""
+    digest = file_service.blob_hasher(size)
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def stage_form_upload(
+    request: Request, file_field: str = "file", max_size: int = MAX_FILE_SIZE
+) -> tuple[dict[str, str], Optional[str], Optional[StagedUpload]]:
+    """
+    Parse a multipart/form-data request body as it streams in: the
+    `file_field` part is copied into TMP_DIR, the other (text) fields are
+    returned. Raises UploadTooLarge as soon as the file passes `max_size`,
+    or up front if Content-Length already does, so the rest of the body
+    is never read; ValueError on a malformed body.
+    Returns (fields, filename, staged file or None if there was none).
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise ValueError("Expected a multipart/form-data body")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_size + MAX_FORM_OVERHEAD:
+        raise UploadTooLarge(max_size)
+
+    # The parser's callbacks are synchronous: queue what they report and
+    # act on it (with async file I/O) after each chunk
+    events: list[tuple] = []
+    header = [b"", b""]
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header[0] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header[1] += data[start:end]
+
+    def on_header_end() -> None:
+        events.append(("header", header[0].lower(), header[1]))
+        header[:] = [b"", b""]
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": lambda: events.append(("begin",)),
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": lambda: events.append(("headers",)),
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end",)),
+    })
+
+    fields: dict[str, str] = {}
+    filename: Optional[str] = None
+    size: Optional[int] = None  # of the file, once its part is complete
+    tmp = TMP_DIR / uuid.uuid4().hex
+    out = None
+    disposition: dict = {}
+    value, field_bytes, copied = b"", 0, 0
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event in events:
+                if event[0] == "begin":
+                    disposition, value = {}, b""
+                elif event[0] == "header" and event[1] == b"content-disposition":
+                    disposition = parse_options_header(event[2])[1]
+                elif event[0] == "headers" and disposition.get(b"name") == file_field.encode():
+                    if filename is not None:
+                        raise ValueError(f"Only one '{file_field}' is allowed")
+                    filename = disposition.get(b"filename", b"").decode("utf-8", errors="replace")
+                    await aiofiles.os.makedirs(TMP_DIR, exist_ok=True)
+                    out = await aiofiles.open(tmp, "wb")
+                elif event[0] == "data" and out is not None:
+                    copied += len(event[1])
+                    if copied > max_size:
+                        raise UploadTooLarge(max_size)
+                    await out.write(event[1])
+                elif event[0] == "data":
+                    field_bytes += len(event[1])
+                    if field_bytes > MAX_FORM_FIELD_BYTES:
+                        raise ValueError("Form fields are too large")
+                    value += event[1]
+                elif event[0] == "end" and out is not None:
+                    await out.close()
+                    out, size = None, copied
+                elif event[0] == "end" and b"name" in disposition:
+                    fields[disposition[b"name"].decode("utf-8", errors="replace")] = value.decode(
+                        "utf-8", errors="replace"
+                    )
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        if out is not None:
+            await out.close()
+        discard(tmp)
+        raise
+    if size is None:
+        discard(tmp)  # no file, or the body ended inside it
+        return fields, filename, None
+    sha = await asyncio.to_thread(hash_file, tmp, size)
+    return fields, filename, StagedUpload(tmp, size, sha)
+
+
+async def store_upload(staged: StagedUpload) -> None:
+    """Move a staged upload into the blob store, or drop it if the content is already there."""
+    if await asyncio.to_thread(file_service.has_blob, staged.sha):
+        discard(staged.path)
+        return
+    await asyncio.to_thread(storage.backend.put_file, file_service.blob_key(staged.sha), staged.path)
+
+
+def release_material_file(session: Session, material: SupplementaryMaterial) -> int:
+    """Drop the material's reference to its file (commits `session`). Returns bytes freed."""
+    if material.file_path and material.file_path.startswith(BLOB_PREFIX):
+        return file_service.release_blob_refs(session, {material.content_hash})
+    freed = 0
+    if material.file_path:
+        key = material_key(material.file_path)
+        stat = storage.backend.stat(key)
+        if stat is not None:
+            storage.backend.delete(key)
+            freed = stat.size
+    session.commit()
+    return freed
+
+
+def storage_report(session: Session) -> dict:
+    """Storage used by uploaded materials, before and after deduplication."""
+    uploads, logical = session.exec(
+        select(func.count(SupplementaryMaterial.id), func.coalesce(func.sum(SupplementaryMaterial.file_size), 0))
+        .where(SupplementaryMaterial.file_path.startswith(BLOB_PREFIX))
+    ).one()
+    distinct, stored = session.exec(
+        select(func.count(), func.coalesce(func.sum(Blob.size), 0)).where(
+            Blob.sha.in_(
+                select(SupplementaryMaterial.content_hash)
+                .where(SupplementaryMaterial.file_path.startswith(BLOB_PREFIX))
+                .distinct()
+            )
+        )
+    ).one()
+    legacy = [stat.size for _, stat in storage.backend.list(LEGACY_PREFIX)]
+    return {
+        "uploads": uploads,
+        "distinct_files": distinct,
+        "upload_bytes": logical,
+        "stored_bytes": stored,
+        "bytes_saved": logical - stored,
+        "legacy_files": len(legacy),
+        "legacy_bytes": sum(legacy),
+    }
+
+
+def discard(path: Path) -> None:
+    with contextlib.suppress(OSError):
+        os.remove(path)
@@ -0,0 +1,82 @@
+"""
+Cache of rewritten branch-preview HTML, keyed by
+(owner, repo, commit SHA, entry path) and the stylesheet proxy URL its
+links were rewritten to. A commit's content never changes, so entries
+are never revalidated, only evicted:
+  - memory tier: ByteLRU bounded by PREVIEW_CACHE_MEMORY_BYTES
+  - disk tier:   storage/cache/previews/, oldest files dropped past
+                 PREVIEW_CACHE_DISK_BYTES
+"""
+import asyncio
+import hashlib
+import os
+from typing import Optional
+
+from .file_service import STORAGE_ROOT
+from .lru import ByteLRU
+
+CACHE_DIR = STORAGE_ROOT / "cache" / "previews"
+MEMORY_BYTES = int(os.environ.get("PREVIEW_CACHE_MEMORY_BYTES", str(16 * 1024 * 1024)))
+DISK_BYTES = int(os.environ.get("PREVIEW_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+
+_memory = ByteLRU(MEMORY_BYTES)
+stats = {"disk_hits": 0, "disk_writes": 0, "disk_evictions": 0}
+
+
+def _key(owner: str, repo: str, sha: str, entry: str, stylesheet_proxy: str) -> str:
+    return f"{owner}/{repo}@{sha}:{entry}|{stylesheet_proxy}"
+
+
+def _disk_path(key: str):
+    return CACHE_DIR / f"{hashlib.sha256(key.encode()).hexdigest()}.html"
+
+
+def _read(key: str) -> Optional[bytes]:
+    path = _disk_path(key)
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    os.utime(path)  # mark as recently used for eviction
+    return data
+
+
+def _write(key: str, data: bytes) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _disk_path(key)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+    files = [(p.stat(), p) for p in CACHE_DIR.glob("*.html")]
+    total = sum(st.st_size for st, _ in files)
+    for st, p in sorted(files, key=lambda item: item[0].st_mtime):
+        if total <= DISK_BYTES:
+            break
+        p.unlink(missing_ok=True)
+        total -= st.st_size
+        stats["disk_evictions"] += 1
+
+
+async def get(owner: str, repo: str, sha: str, entry: str, stylesheet_proxy: str = "") -> Optional[str]:
+    key = _key(owner, repo, sha, entry, stylesheet_proxy)
+    data = _memory.get(key)
+    if data is None:
+        data = await asyncio.to_thread(_read, key)
+        if data is None:
+            return None
+        stats["disk_hits"] += 1
+        _memory.put(key, data)
+    return data.decode("utf-8")
+
+
+async def put(owner: str, repo: str, sha: str, entry: str, html: str, stylesheet_proxy: str = "") -> None:
+    key = _key(owner, repo, sha, entry, stylesheet_proxy)
+    data = html.encode("utf-8")
+    _memory.put(key, data)
+    await asyncio.to_thread(_write, key, data)
+    stats["disk_writes"] += 1
+
+
+def get_stats() -> dict:
+    return {"memory": _memory.stats(), **stats}
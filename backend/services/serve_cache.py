@@ -0,0 +1,156 @@
+"""
+In-memory cache in front of /api/assignments/{id}/serve and /files/...,
+so popular assignments are served without a database lookup, manifest
+read or file read per request.
+
+Each file entry holds the content (and any precompressed variants) of
+one file up to MAX_FILE_BYTES plus the validators for 304s; local files
+are checked against their (mtime, size) on every hit. Lookups that
+404ed are cached too, for NEGATIVE_TTL seconds. Everything is bounded
+by SERVE_CACHE_MEMORY_BYTES.
+
+invalidate(assignment_id) drops an assignment's entries when it is
+edited, deleted or re-imported. Keys carry a per-assignment generation,
+so a response built from data read before an invalidation is never
+stored after it. The cache is per process (as deployed: one app process).
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from . import storage
+from .lru import ByteLRU
+
+MEMORY_BYTES = int(os.environ.get("SERVE_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+MAX_FILE_BYTES = int(os.environ.get("SERVE_CACHE_MAX_FILE_BYTES", str(1024 * 1024)))
+NEGATIVE_TTL = float(os.environ.get("SERVE_CACHE_NEGATIVE_TTL", "30"))
+ENTRY_OVERHEAD = 256  # rough per-entry bookkeeping, so tiny entries still count
+
+ENTRY = ""  # file_path slot of the key under which /serve caches the entry file path
+
+
+class CachedFile:
+    __slots__ = ("path", "stat_key", "etag", "last_modified", "bodies")
+
+    def __init__(
+        self, path: Optional[Path], stat_key: Optional[tuple], etag: str, last_modified: float, bodies: dict
+    ):
+        self.path = path
+        self.stat_key = stat_key
+        self.etag = etag
+        self.last_modified = last_modified
+        self.bodies = bodies  # Content-Encoding (None for plain) -> content
+
+
+class Missing:
+    __slots__ = ("detail", "expires_at")
+
+    def __init__(self, detail: str):
+        self.detail = detail
+        self.expires_at = time.monotonic() + NEGATIVE_TTL
+
+
+def _sizeof(value) -> int:
+    if isinstance(value, CachedFile):
+        return ENTRY_OVERHEAD + sum(len(body) for body in value.bodies.values())
+    return ENTRY_OVERHEAD
+
+
+_memory = ByteLRU(MEMORY_BYTES, sizeof=_sizeof)
+_lock = threading.Lock()  # file routes are sync, so they run on the threadpool
+_generations: dict[int, int] = {}
+stats = {"stale": 0, "negative_hits": 0, "invalidations": 0, "too_large": 0}
+
+
+def _stat_key(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def key(assignment_id: int, file_path: str) -> tuple:
+    """Cache key for a lookup; take it before reading anything the response depends on."""
+    return assignment_id, _generations.get(assignment_id, 0), file_path
+
+
+def get(cache_key: tuple) -> Union[CachedFile, Missing, str, None]:
+    with _lock:
+        value = _memory.get(cache_key)
+        if value is None:
+            return None
+        if isinstance(value, Missing):
+            if value.expires_at > time.monotonic():
+                stats["negative_hits"] += 1
+                return value
+        elif not isinstance(value, CachedFile) or value.path is None or _stat_key(value.path) == value.stat_key:
+            return value
+        stats["stale"] += 1
+        _memory.pop(cache_key)
+        return None
+
+
+def _put(cache_key: tuple, value) -> None:
+    with _lock:
+        if cache_key[1] == _generations.get(cache_key[0], 0):
+            _memory.put(cache_key, value)
+
+
+def put_missing(cache_key: tuple, detail: str) -> None:
+    _put(cache_key, Missing(detail))
+
+
+def put_entry_path(cache_key: tuple, file_path: str) -> None:
+    _put(cache_key, file_path)
+
+
+def put_file(
+    cache_key: tuple,
+    key: str,
+    etag: str,
+    last_modified: float,
+    variants: Optional[dict[str, str]] = None,
+) -> None:
+    """Read the object `key` (and its variants) into the cache if it's small enough."""
+    path = storage.backend.local_path(key)
+    if path is not None:
+        stat_key = _stat_key(path)
+        size = stat_key[1] if stat_key else None
+    else:
+        # Remote objects aren't revalidated on hits (that would cost a
+        # request each); blobs never change and invalidate() covers the rest
+        stat = storage.backend.stat(key)
+        stat_key, size = None, stat.size if stat else None
+    if size is None:
+        return
+    if size > MAX_FILE_BYTES:
+        stats["too_large"] += 1
+        return
+    bodies = {None: storage.backend.read_bytes(key)}
+    for encoding, variant in (variants or {}).items():
+        bodies[encoding] = storage.backend.read_bytes(variant)
+    if any(body is None for body in bodies.values()):
+        return  # e.g. removed by a concurrent re-import
+    if len(bodies[None]) != size:
+        return  # changed while we read it
+    _put(cache_key, CachedFile(path, stat_key, etag, last_modified, bodies))
+
+
+def invalidate(assignment_id: int) -> None:
+    with _lock:
+        _generations[assignment_id] = _generations.get(assignment_id, 0) + 1
+        _memory.pop_matching(lambda k: k[0] == assignment_id)
+        stats["invalidations"] += 1
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {
+            **_memory.stats(),
+            **stats,
+            "max_file_bytes": MAX_FILE_BYTES,
+            "negative_ttl": NEGATIVE_TTL,
+        }
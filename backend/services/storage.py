@@ -0,0 +1,236 @@
+"""
+Object storage for everything file_service and material_service keep.
+
+Objects are addressed by keys that mirror the on-disk layout under
+storage/ ("blobs/ab/ab12...", "12/manifest.json", "materials/..."), so
+the local backend reads existing data as is, and copying storage/ into
+a bucket (e.g. `aws s3 sync storage/ s3://bucket/prefix/`) moves a
+deployment to S3. STORAGE_BACKEND selects the backend:
+  local  files under STORAGE_ROOT (default backend/storage/)
+  s3     an S3-compatible bucket (AWS, MinIO, ...): S3_BUCKET, S3_PREFIX,
+         S3_ENDPOINT_URL (for MinIO and other stand-ins), S3_REGION;
+         credentials come from the usual AWS environment. Needs boto3.
+With STORAGE_PRESIGNED_URLS=1 the file and download routes redirect
+remote objects to presigned URLs (valid STORAGE_PRESIGN_SECONDS)
+instead of passing the bytes through the app.
+
+Scratch files (uploads in progress, temp files) and caches stay on the
+local disk whatever the backend.
+"""
+import contextlib
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+STORAGE_ROOT = Path(os.environ.get("STORAGE_ROOT") or Path(__file__).parent.parent / "storage")
+BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+PRESIGNED_URLS = os.environ.get("STORAGE_PRESIGNED_URLS", "").lower() in ("1", "true", "yes")
+PRESIGN_SECONDS = int(os.environ.get("STORAGE_PRESIGN_SECONDS", "300"))
+CHUNK_SIZE = 64 * 1024
+
+
+class ObjectStat(NamedTuple):
+    size: int
+    mtime: float  # seconds since the epoch
+
+
+class LocalStorage:
+    """Objects are files under `root`; keys are their relative paths."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """The object's file, or None for keys that would leave the root (e.g. through a symlink)."""
+        root = self.root.resolve()
+        path = (root / key).resolve()
+        return path if path.is_relative_to(root) else None
+
+    def put_file(self, key: str, source: Path) -> None:
+        """Store `source` (a scratch file, consumed) as `key`."""
+        dest = self.root / key
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(source, dest)
+        except OSError:
+            # Scratch space on another filesystem
+            tmp = dest.with_name(f"{dest.name}.{uuid.uuid4().hex}.tmp")
+            with open(source, "rb") as src, open(tmp, "wb") as out:
+                while chunk := src.read(CHUNK_SIZE):
+                    out.write(chunk)
+            os.replace(tmp, dest)
+            source.unlink()
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        dest = self.root / key
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f"{dest.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, dest)
+
+    def open(self, key: str) -> BinaryIO:
+        """Read stream of an object; raises FileNotFoundError if there is none."""
+        path = self.local_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        return open(path, "rb")
+
+    def read_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            with self.open(key) as f:
+                return f.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        path = self.local_path(key)
+        if path is None or not path.is_file():
+            return None
+        st = path.stat()
+        return ObjectStat(st.st_size, st.st_mtime)
+
+    def delete(self, key: str) -> None:
+        path = self.root / key
+        with contextlib.suppress(FileNotFoundError):
+            path.unlink()
+        # Drop directories the object leaves empty, as a bucket would
+        parent = path.parent
+        while parent != self.root and parent.is_relative_to(self.root):
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+
+    def list(self, prefix: str) -> Iterator[tuple[str, ObjectStat]]:
+        """(key, stat) of every object whose key starts with `prefix` (a directory, ending in "/")."""
+        base = self.root / prefix
+        if not base.is_dir():
+            return
+        for path in sorted(base.rglob("*")):
+            if path.is_file() and not path.is_symlink():
+                st = path.stat()
+                yield path.relative_to(self.root).as_posix(), ObjectStat(st.st_size, st.st_mtime)
+
+    def presigned_url(self, key: str, **response_headers) -> Optional[str]:
+        return None  # local files are served by the app itself
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, under an optional key prefix."""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+    ):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install boto3)") from None
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self._client_error = ClientError
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _missing(self, e: Exception) -> bool:
+        code = e.response.get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+    def put_file(self, key: str, source: Path) -> None:
+        self.client.upload_file(str(source), self.bucket, self._key(key))
+        source.unlink()
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except self._client_error as e:
+            if self._missing(e):
+                raise FileNotFoundError(key) from None
+            raise
+
+    def read_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            with self.open(key) as body:
+                return body.read()
+        except FileNotFoundError:
+            return None
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if self._missing(e):
+                return None
+            raise
+        return ObjectStat(head["ContentLength"], head["LastModified"].timestamp())
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix: str) -> Iterator[tuple[str, ObjectStat]]:
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=self._key(prefix)
+        )
+        for page in pages:
+            for obj in page.get("Contents", []):
+                key = obj["Key"][len(self.prefix):]
+                yield key, ObjectStat(obj["Size"], obj["LastModified"].timestamp())
+
+    def presigned_url(
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        content_disposition: Optional[str] = None,
+        content_encoding: Optional[str] = None,
+        cache_control: Optional[str] = None,
+    ) -> Optional[str]:
+        """A GET URL for the object that answers with the given headers."""
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        overrides = {
+            "ResponseContentType": content_type,
+            "ResponseContentDisposition": content_disposition,
+            "ResponseContentEncoding": content_encoding,
+            "ResponseCacheControl": cache_control,
+        }
+        params.update({k: v for k, v in overrides.items() if v})
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=PRESIGN_SECONDS)
+
+
+def _create_backend():
+    if BACKEND == "local":
+        return LocalStorage(STORAGE_ROOT)
+    if BACKEND == "s3":
+        bucket = os.environ.get("S3_BUCKET")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        return S3Storage(
+            bucket,
+            prefix=os.environ.get("S3_PREFIX", ""),
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
+            region=os.environ.get("S3_REGION") or None,
+        )
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {BACKEND!r} (expected local or s3)")
+
+
+backend = _create_backend()
+
+
+def iter_object(key: str) -> Iterator[bytes]:
+    """The object's content in chunks (blocking I/O)."""
+    with backend.open(key) as source:
+        while chunk := source.read(CHUNK_SIZE):
+            yield chunk
@@ -0,0 +1,137 @@
+"""
+Storage side of resumable material uploads.
+
+An UploadSession row tracks how many bytes of a declared size have been
+stored in material_service.TMP_DIR/{id}.part. Chunks are written at the
+committed offset, and whatever arrived before a dropped connection is
+kept, so the client resumes from `received` instead of from zero.
+Sessions expire SESSION_TTL seconds after their last chunk; a sweeper
+started from the app lifespan removes expired sessions, their partial
+files and temp files left behind by interrupted uploads.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import aiofiles
+import aiofiles.os
+from sqlmodel import Session, select
+
+from ..database import engine
+from ..models.upload_session import UploadSession
+from . import material_service
+
+SESSION_TTL = float(os.environ.get("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+MAX_CHUNK_SIZE = int(os.environ.get("UPLOAD_MAX_CHUNK_SIZE", str(8 * 1024 * 1024)))
+SWEEP_SECONDS = 600.0
+
+_locks: dict[str, asyncio.Lock] = {}
+_sweeper: Optional[asyncio.Task] = None
+
+
+class ChunkTooLarge(Exception):
+    pass
+
+
+def part_path(upload_id: str) -> Path:
+    return material_service.TMP_DIR / f"{upload_id}.part"
+
+
+def expiry() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=SESSION_TTL)
+
+
+def lock(upload_id: str) -> asyncio.Lock:
+    """Serializes chunk writes and finalization of one upload."""
+    return _locks.setdefault(upload_id, asyncio.Lock())
+
+
+async def write_chunk(upload: UploadSession, chunks: AsyncIterator[bytes]) -> int:
+    """
+    Write `chunks` at upload.received and return how many bytes were
+    stored. Raises ChunkTooLarge (storing nothing) if the chunk runs past
+    the declared size or MAX_CHUNK_SIZE.
+    """
+    offset = upload.received
+    limit = min(upload.size - offset, MAX_CHUNK_SIZE)
+    path = part_path(upload.id)
+    await aiofiles.os.makedirs(path.parent, exist_ok=True)
+    written = 0
+    async with aiofiles.open(path, "r+b" if path.exists() else "wb") as out:
+        await out.seek(offset)
+        try:
+            async for chunk in chunks:
+                written += len(chunk)
+                if written > limit:
+                    written = 0
+                    raise ChunkTooLarge(f"Chunk exceeds {limit} bytes")
+                await out.write(chunk)
+        finally:
+            # Drop anything past what we're about to record (e.g. from an earlier failed chunk)
+            await out.truncate(offset + written)
+    return written
+
+
+async def stage(upload: UploadSession) -> material_service.StagedUpload:
+    """The completed upload as a StagedUpload, ready for material_service.store_upload."""
+    path = part_path(upload.id)
+    sha = await asyncio.to_thread(material_service.hash_file, path, upload.size)
+    return material_service.StagedUpload(path, upload.size, sha)
+
+
+def discard(upload_id: str) -> None:
+    material_service.discard(part_path(upload_id))
+    _locks.pop(upload_id, None)
+
+
+def sweep() -> int:
+    """Remove expired sessions and stale temp files. Returns sessions removed."""
+    with Session(engine) as session:
+        expired = session.exec(
+            select(UploadSession).where(UploadSession.expires_at < datetime.utcnow())
+        ).all()
+        removed = 0
+        for upload in expired:
+            if lock(upload.id).locked():
+                continue  # a chunk is being written right now
+            discard(upload.id)
+            session.delete(upload)
+            removed += 1
+        session.commit()
+        live = set(session.exec(select(UploadSession.id)).all())
+
+    # Partial files without a session, and temp files of uploads that never finished
+    cutoff = time.time() - SESSION_TTL
+    if material_service.TMP_DIR.exists():
+        for path in material_service.TMP_DIR.iterdir():
+            if path.suffix == ".part" and path.stem in live:
+                continue
+            with contextlib.suppress(OSError):
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+    return removed
+
+
+async def _sweep_loop() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(sweep)
+        except Exception:
+            pass  # try again next round
+        await asyncio.sleep(SWEEP_SECONDS)
+
+
+async def start() -> None:
+    global _sweeper
+    _sweeper = asyncio.create_task(_sweep_loop())
+
+
+async def stop() -> None:
+    if _sweeper is not None:
+        _sweeper.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _sweeper
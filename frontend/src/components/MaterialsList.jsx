@@ -1,6 +1,6 @@
 import { useState } from 'react'
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query'
-import { getMaterials, addMaterial, uploadMaterial, deleteMaterial, materialDownloadUrl } from '../lib/api'
+import { getMaterials, addMaterial, uploadMaterialResumable, deleteMaterial, materialDownloadUrl } from '../lib/api'
 import { useAuth } from '../contexts/AuthContext'
 
 const TYPE_LABELS = {
@@ -31,6 +31,7 @@ export default function MaterialsList({ assignmentId, assignmentOwnerId }) {
   const [form, setForm] = useState({ title: '', url: '', material_type: 'article', excerpt: '' })
   const [file, setFile] = useState(null)
   const [uploadError, setUploadError] = useState('')
+  const [uploadProgress, setUploadProgress] = useState(0)
 
   const { data: materials = [], isLoading } = useQuery({
     queryKey: ['materials', assignmentId],
@@ -47,7 +48,7 @@ export default function MaterialsList({ assignmentId, assignmentOwnerId }) {
   })
 
   const uploadMut = useMutation({
-    mutationFn: (formData) => uploadMaterial(assignmentId, formData),
+    mutationFn: ({ file, fields }) => uploadMaterialResumable(assignmentId, file, fields, setUploadProgress),
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ['materials', assignmentId] })
       resetForm()
@@ -65,6 +66,7 @@ export default function MaterialsList({ assignmentId, assignmentOwnerId }) {
     setFile(null)
     setShowForm(false)
     setUploadError('')
+    setUploadProgress(0)
   }
 
   const handleSubmit = (e) => {
@@ -73,12 +75,11 @@ export default function MaterialsList({ assignmentId, assignmentOwnerId }) {
 
     if (formMode === 'upload') {
       if (!file) { setUploadError('Please select a file'); return }
-      const formData = new FormData()
-      formData.append('file', file)
-      formData.append('title', form.title)
-      formData.append('material_type', form.material_type)
-      if (form.excerpt) formData.append('excerpt', form.excerpt)
-      uploadMut.mutate(formData)
+      setUploadProgress(0)
+      uploadMut.mutate({
+        file,
+        fields: { title: form.title, material_type: form.material_type, excerpt: form.excerpt || null },
+      })
     } else {
       if (!form.url) { setUploadError('Please enter a URL'); return }
       addMut.mutate(form)
@@ -104,6 +105,8 @@ export default function MaterialsList({ assignmentId, assignmentOwnerId }) {
             {m.file_path ? (
               <a
                 href={materialDownloadUrl(assignmentId, m.id)}
+                target="_blank"
+                rel="noopener noreferrer"
                 className="text-sm font-medium text-brand-600 hover:underline"
               >
                 {m.title}
@@ -218,7 +221,7 @@ export default function MaterialsList({ assignmentId, assignmentOwnerId }) {
           />
           <div className="flex gap-2">
             <button type="submit" disabled={isPending} className="bg-brand-600 text-white text-sm rounded px-4 py-1.5 hover:bg-brand-700 disabled:opacity-50">
-              {isPending ? (formMode === 'upload' ? 'Uploading...' : 'Adding...') : (formMode === 'upload' ? 'Upload' : 'Add')}
+              {isPending ? (formMode === 'upload' ? `Uploading... ${Math.round(uploadProgress * 100)}%` : 'Adding...') : (formMode === 'upload' ? 'Upload' : 'Add')}
             </button>
             <button type="button" onClick={resetForm} className="text-sm text-gray-500 hover:text-gray-700">
               Cancel
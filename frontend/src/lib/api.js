@@ -53,13 +53,47 @@ export const getAssignment = (id) =>
 export const importFromGitHub = (data) =>
   api.post('/assignments/import', data).then(r => r.data)
 
+export const syncAssignment = (id) =>
+  api.post(`/assignments/${id}/sync`).then(r => r.data)
+
+export const getImportJob = (jobId) =>
+  api.get(`/assignments/imports/${jobId}`).then(r => r.data)
+
+// Import and sync run in the background; poll the job until it finishes.
+// Resolves with the finished job, rejects with its error if it failed.
+export async function waitForImportJob(job, onProgress, intervalMs = 1500) {
+  while (job.status === 'queued' || job.status === 'running') {
+    onProgress?.(job)
+    await new Promise(resolve => setTimeout(resolve, intervalMs))
+    job = await getImportJob(job.id)
+  }
+  if (job.status === 'failed') {
+    throw new Error(job.error || 'Import failed')
+  }
+  return job
+}
+
 export const updateAssignment = (id, data) =>
   api.patch(`/assignments/${id}`, data).then(r => r.data)
 
 export const deleteAssignment = (id) =>
   api.delete(`/assignments/${id}`).then(r => r.data)
 
-export const serveUrl = (id) => `/api/assignments/${id}/serve`
+// Path-based, so the entry file's relative links (CSS, JS, images) resolve too
+export const serveUrl = (assignment) =>
+  `/api/assignments/${assignment.id}/files/${encodeURI(assignment.file_path)}`
+
+// The export needs the auth header, so fetch it and hand the browser a blob URL
+export async function downloadAssignmentZip(id) {
+  const r = await api.get(`/assignments/${id}/export`, { responseType: 'blob', timeout: 0 })
+  const match = /filename="([^"]+)"/.exec(r.headers['content-disposition'] || '')
+  const url = URL.createObjectURL(r.data)
+  const link = document.createElement('a')
+  link.href = url
+  link.download = match ? match[1] : `assignment-${id}.zip`
+  link.click()
+  URL.revokeObjectURL(url)
+}
 
 // ── Materials ────────────────────────────────────────────────────────────────
 
@@ -74,6 +108,36 @@ export const uploadMaterial = (assignmentId, formData) =>
     headers: { 'Content-Type': 'multipart/form-data' },
   }).then(r => r.data)
 
+const UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+const UPLOAD_MAX_RETRIES = 8
+
+// Resumable upload: declare the file, PUT it in chunks and, when a chunk
+// fails (e.g. the Wi-Fi drops), ask the server how much it kept and go on
+// from there. `fields` holds title, material_type and excerpt.
+export async function uploadMaterialResumable(assignmentId, file, fields, onProgress) {
+  const base = `/assignments/${assignmentId}/materials/uploads`
+  let upload = (await api.post(base, { ...fields, filename: file.name, size: file.size })).data
+  let failures = 0
+  while (upload.received < upload.size) {
+    onProgress?.(upload.received / upload.size)
+    const chunk = file.slice(upload.received, upload.received + UPLOAD_CHUNK_SIZE)
+    try {
+      upload = (await api.put(`${base}/${upload.id}`, chunk, {
+        params: { offset: upload.received },
+        headers: { 'Content-Type': 'application/octet-stream' },
+      })).data
+      failures = 0
+    } catch (err) {
+      const status = err.response?.status
+      if ((status && status !== 409 && status < 500) || ++failures > UPLOAD_MAX_RETRIES) throw err
+      await new Promise(resolve => setTimeout(resolve, Math.min(30000, 1000 * 2 ** failures)))
+      upload = (await api.get(`${base}/${upload.id}`)).data
+    }
+  }
+  onProgress?.(1)
+  return (await api.post(`${base}/${upload.id}/complete`)).data
+}
+
 export const materialDownloadUrl = (assignmentId, materialId) =>
   `/api/assignments/${assignmentId}/materials/${materialId}/download`
 
@@ -1,30 +1,49 @@
 import { useState } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { importFromGitHub } from '../lib/api'
+import { importFromGitHub, waitForImportJob } from '../lib/api'
+
+function importLabel(job) {
+  if (!job || job.status === 'queued') {
+    return job?.attempts ? 'Retrying...' : 'Queued...'
+  }
+  if (!job.files_total) return 'Importing...'
+  return `Importing... ${job.files_done}/${job.files_total} files`
+}
 
 export default function AdminSubmit() {
   const navigate = useNavigate()
   const [form, setForm] = useState({
     title: '', github_url: '', description: '', subject_area: '', tags: '',
+    exclude: '', max_mb: '',
   })
   const [error, setError] = useState('')
   const [loading, setLoading] = useState(false)
+  const [job, setJob] = useState(null)
 
   const handleSubmit = async (e) => {
     e.preventDefault()
     setError('')
     setLoading(true)
     try {
+      const { exclude, max_mb, ...fields } = form
       const payload = {
-        ...form,
-        tags: form.tags ? form.tags.split(',').map(t => t.trim()).filter(Boolean) : [],
+        ...fields,
+        tags: fields.tags ? fields.tags.split(',').map(t => t.trim()).filter(Boolean) : [],
       }
-      const assignment = await importFromGitHub(payload)
-      navigate(`/assignments/${assignment.id}`)
+      // Without these the repo's own .eduimport.json (if any) decides what's imported
+      if (exclude || max_mb) {
+        payload.import_manifest = {
+          exclude: exclude ? exclude.split(',').map(t => t.trim()).filter(Boolean) : [],
+          max_bytes: max_mb ? Math.round(Number(max_mb) * 1024 * 1024) : null,
+        }
+      }
+      const done = await waitForImportJob(await importFromGitHub(payload), setJob)
+      navigate(`/assignments/${done.assignment_id}`)
     } catch (err) {
-      setError(err.response?.data?.detail || 'Import failed')
+      setError(err.response?.data?.detail || err.message || 'Import failed')
     } finally {
       setLoading(false)
+      setJob(null)
     }
   }
 
@@ -86,12 +105,35 @@ export default function AdminSubmit() {
             className="w-full border border-gray-200 rounded-lg px-3 py-2 text-sm"
           />
         </div>
+        <div className="grid grid-cols-2 gap-3">
+          <div>
+            <label className="block text-sm font-medium text-gray-700 mb-1">Skip files (globs)</label>
+            <input
+              type="text"
+              placeholder="node_modules, *.mp4, data/*"
+              value={form.exclude}
+              onChange={(e) => setForm(f => ({ ...f, exclude: e.target.value }))}
+              className="w-full border border-gray-200 rounded-lg px-3 py-2 text-sm"
+            />
+          </div>
+          <div>
+            <label className="block text-sm font-medium text-gray-700 mb-1">Size limit (MB)</label>
+            <input
+              type="number"
+              min="0"
+              step="any"
+              value={form.max_mb}
+              onChange={(e) => setForm(f => ({ ...f, max_mb: e.target.value }))}
+              className="w-full border border-gray-200 rounded-lg px-3 py-2 text-sm"
+            />
+          </div>
+        </div>
         <button
           type="submit"
           disabled={loading}
           className="w-full bg-brand-600 text-white rounded-lg py-2 text-sm font-medium hover:bg-brand-700 disabled:opacity-50"
         >
-          {loading ? 'Importing...' : 'Import Assignment'}
+          {loading ? importLabel(job) : 'Import Assignment'}
         </button>
       </form>
     </div>
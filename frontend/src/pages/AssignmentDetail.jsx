@@ -1,7 +1,7 @@
 import { useState } from 'react'
 import { useParams } from 'react-router-dom'
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query'
-import { getAssignment, updateAssignment, serveUrl } from '../lib/api'
+import { getAssignment, updateAssignment, syncAssignment, waitForImportJob, serveUrl, downloadAssignmentZip } from '../lib/api'
 import { parseTags } from '../lib/utils'
 import { useAuth } from '../contexts/AuthContext'
 import CommentThread from '../components/CommentThread'
@@ -36,6 +36,15 @@ export default function AssignmentDetail() {
     },
   })
 
+  const syncMut = useMutation({
+    mutationFn: async () => waitForImportJob(await syncAssignment(id)),
+    onSuccess: () => queryClient.invalidateQueries({ queryKey: ['assignment', id] }),
+  })
+
+  const exportMut = useMutation({
+    mutationFn: () => downloadAssignmentZip(id),
+  })
+
   const canEdit = user && assignment && (
     assignment.created_by_id === user.id || user.role === 'admin'
   )
@@ -69,12 +78,30 @@ export default function AssignmentDetail() {
       <div className="flex items-start justify-between gap-4 mb-2">
         <h1 className="text-2xl font-bold text-gray-900">{assignment.title}</h1>
         {canEdit && !editing && (
-          <button
-            onClick={startEditing}
-            className="text-sm text-brand-600 hover:text-brand-700 px-3 py-1 border border-brand-200 rounded-md hover:bg-brand-50 transition-colors flex-shrink-0"
-          >
-            Edit
-          </button>
+          <div className="flex gap-2 flex-shrink-0">
+            {assignment.github_url && (
+              <button
+                onClick={() => syncMut.mutate()}
+                disabled={syncMut.isPending}
+                className="text-sm text-brand-600 hover:text-brand-700 px-3 py-1 border border-brand-200 rounded-md hover:bg-brand-50 transition-colors disabled:opacity-50"
+              >
+                {syncMut.isPending ? 'Syncing...' : 'Sync from GitHub'}
+              </button>
+            )}
+            <button
+              onClick={() => exportMut.mutate()}
+              disabled={exportMut.isPending}
+              className="text-sm text-brand-600 hover:text-brand-700 px-3 py-1 border border-brand-200 rounded-md hover:bg-brand-50 transition-colors disabled:opacity-50"
+            >
+              {exportMut.isPending ? 'Preparing ZIP...' : 'Download ZIP'}
+            </button>
+            <button
+              onClick={startEditing}
+              className="text-sm text-brand-600 hover:text-brand-700 px-3 py-1 border border-brand-200 rounded-md hover:bg-brand-50 transition-colors"
+            >
+              Edit
+            </button>
+          </div>
         )}
       </div>
       {assignment.subject_area && !editing && (
@@ -151,7 +178,7 @@ export default function AssignmentDetail() {
           {assignment.file_path ? (
             <div className="border border-gray-200 rounded-lg overflow-hidden bg-white">
               <iframe
-                src={serveUrl(assignment.id)}
+                src={serveUrl(assignment)}
                 title={assignment.title}
                 className="w-full border-0"
                 style={{ height: '700px' }}
@@ -0,0 +1,160 @@
+"""
+Database benchmark: concurrent page loads while comments are posted.
+
+Usage (from edu-resource-site/):
+    uv run python scripts/bench_db.py                          # SQLite, default vs tuned pragmas
+    uv run python scripts/bench_db.py --postgres URL           # ... and a Postgres database
+    uv run python scripts/bench_db.py --readers 16 --writers 4 --seconds 10
+
+Each setup gets a fresh database seeded with assignments and comments
+(the Postgres one must be empty and disposable: its tables are dropped
+afterwards). Reader threads then load assignment pages (the assignment
+plus its comment thread, as GET /api/assignments/{id} and /comments do)
+while writer threads post comments, each in its own transaction, as
+POST /comments does. Reported: reads and writes per second, read and
+write latency percentiles, and requests that failed (e.g. "database is
+locked"). The SQLite baseline is the previous configuration: rollback
+journal, synchronous=FULL and no pragmas.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlmodel import Session, SQLModel, select  # noqa: E402
+
+from backend.database import SQLITE_PRAGMAS, make_engine  # noqa: E402
+from backend.models import Assignment, Comment, User  # noqa: E402
+
+ASSIGNMENTS = 200
+COMMENTS_PER_ASSIGNMENT = 50
+
+
+def seed(engine) -> tuple[list[int], list[int]]:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        users = [User(email=f"user{i}@bench.test", display_name=f"User {i}", hashed_password="x") for i in range(20)]
+        session.add_all(users)
+        session.flush()
+        assignments = [Assignment(title=f"Assignment {i}", description="Benchmark") for i in range(ASSIGNMENTS)]
+        session.add_all(assignments)
+        session.flush()
+        session.add_all(
+            Comment(assignment_id=a.id, user_id=random.choice(users).id, content="Seed comment " * 10)
+            for a in assignments
+            for _ in range(COMMENTS_PER_ASSIGNMENT)
+        )
+        session.commit()
+        return [a.id for a in assignments], [u.id for u in users]
+
+
+def load_page(engine, assignment_id: int) -> None:
+    with Session(engine) as session:
+        session.get(Assignment, assignment_id)
+        session.exec(
+            select(Comment, User.display_name)
+            .join(User, Comment.user_id == User.id)
+            .where(Comment.assignment_id == assignment_id)
+            .order_by(Comment.created_at)
+        ).all()
+
+
+def post_comment(engine, assignment_id: int, user_id: int) -> None:
+    with Session(engine) as session:
+        session.add(Comment(assignment_id=assignment_id, user_id=user_id, content="Benchmark comment"))
+        session.commit()
+
+
+def run(engine, readers: int, writers: int, seconds: float) -> dict:
+    assignment_ids, user_ids = seed(engine)
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(kind: str) -> None:
+        own, failed = [], 0
+        while time.perf_counter() < deadline:
+            assignment_id = random.choice(assignment_ids)
+            started = time.perf_counter()
+            try:
+                if kind == "read":
+                    load_page(engine, assignment_id)
+                else:
+                    post_comment(engine, assignment_id, random.choice(user_ids))
+            except Exception:
+                failed += 1
+                continue
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies[kind].extend(own)
+            errors[kind] += failed
+
+    threads = [threading.Thread(target=worker, args=("read",)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=("write",)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"latencies": latencies, "errors": errors, "seconds": seconds}
+
+
+def percentile(values: list[float], p: int) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+
+
+def report(label: str, result: dict) -> None:
+    reads, writes = result["latencies"]["read"], result["latencies"]["write"]
+    seconds = result["seconds"]
+    print(
+        f"  {label:<20} {len(reads) / seconds:9.0f} {len(writes) / seconds:9.0f}"
+        f" {percentile(reads, 50) * 1000:9.1f} {percentile(reads, 99) * 1000:9.1f}"
+        f" {percentile(writes, 50) * 1000:9.1f} {percentile(writes, 99) * 1000:9.1f}"
+        f" {result['errors']['read']:6d} {result['errors']['write']:6d}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--postgres", metavar="URL", help="also benchmark this (empty) Postgres database")
+    args = parser.parse_args()
+
+    setups = [
+        ("sqlite, no pragmas", "sqlite", {}),
+        ("sqlite, tuned", "sqlite", SQLITE_PRAGMAS),
+    ]
+    if args.postgres:
+        setups.append(("postgres, pooled", args.postgres, None))
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g} s per setup")
+    print(f"  {'':<20} {'reads/s':>9} {'writes/s':>9} {'read p50':>9} {'read p99':>9}"
+          f" {'write p50':>9} {'write p99':>9} {'r err':>6} {'w err':>6}   (latencies in ms)")
+    for label, url, pragmas in setups:
+        with tempfile.TemporaryDirectory() as tmp:
+            if url == "sqlite":
+                engine = make_engine(f"sqlite:///{tmp}/bench.db", pragmas)
+            else:
+                engine = make_engine(url)
+            try:
+                result = run(engine, args.readers, args.writers, args.seconds)
+            finally:
+                if url != "sqlite":
+                    SQLModel.metadata.drop_all(engine)
+                engine.dispose()
+        report(label, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Branch-preview URL rewriter: fixture check and throughput benchmark.
+
+Usage (from edu-resource-site/):
+    uv run python scripts/bench_rewriter.py            # check fixtures, then benchmark
+    uv run python scripts/bench_rewriter.py --update   # regenerate *.expected.html
+
+Each fixtures/rewriter/NAME.html is rewritten as if it were the entry file
+of a branch and compared with NAME.expected.html, both in one call and
+fed in small chunks (the output must not depend on chunk boundaries).
+The benchmark then compares MB/s of the tokenizer against the regex
+rewrite it replaced, on a document built by repeating the fixtures
+(nearly every tag carries a URL, so this is a worst case for the tokenizer).
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.services.html_rewriter import HtmlUrlRewriter  # noqa: E402
+
+FIXTURES = Path(__file__).parent / "fixtures" / "rewriter"
+ROOT_URL = "https://raw.githubusercontent.com/owner/repo/0123456789abcdef0123456789abcdef01234567/"
+DOCUMENT_URL = ROOT_URL + "units/index.html"
+BENCH_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+
+
+def new_rewriter() -> HtmlUrlRewriter:
+    return HtmlUrlRewriter(DOCUMENT_URL, ROOT_URL, lambda url: "//preview.test/css?u=" + url)
+
+
+def rewrite_chunked(html: str, size: int) -> str:
+    rewriter = new_rewriter()
+    parts = [rewriter.feed(html[i:i + size]) for i in range(0, len(html), size)]
+    return "".join(parts) + rewriter.close()
+
+
+def regex_rewrite(html: str) -> str:
+    """The original single re.sub rewrite, kept as the benchmark baseline."""
+    return re.sub(
+        r'(src|href)="(?!https?://|data:|#|mailto:)([^"]+)"',
+        lambda m: f'{m.group(1)}="{ROOT_URL}{m.group(2)}"',
+        html,
+    )
+
+
+def check_fixtures(update: bool) -> bool:
+    ok = True
+    for source in sorted(FIXTURES.glob("*.html")):
+        if source.name.endswith(".expected.html"):
+            continue
+        expected_path = source.with_name(source.stem + ".expected.html")
+        html = source.read_text(encoding="utf-8")
+        output = new_rewriter().rewrite(html)
+        if update:
+            expected_path.write_text(output, encoding="utf-8")
+            print(f"  Updated: {expected_path.name}")
+            continue
+        expected = expected_path.read_text(encoding="utf-8")
+        problems = []
+        if output != expected:
+            problems.append("output differs from expected")
+        for size in (1, 7, 64, 1024):
+            if rewrite_chunked(html, size) != output:
+                problems.append(f"chunk size {size} changes the output")
+        print(f"  {'FAIL' if problems else 'ok'}: {source.name}" + "".join(f"\n    - {p}" for p in problems))
+        ok = ok and not problems
+    return ok
+
+
+def throughput(label: str, fn, html: str, rounds: int = 3) -> None:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn(html)
+        best = min(best, time.perf_counter() - started)
+    mb = len(html.encode("utf-8")) / (1024 * 1024)
+    print(f"  {label:<32} {mb / best:8.1f} MB/s")
+
+
+def benchmark() -> None:
+    corpus = "".join(
+        p.read_text(encoding="utf-8")
+        for p in sorted(FIXTURES.glob("*.html"))
+        if not p.name.endswith(".expected.html")
+    )
+    # A repeated <base href="dir/"> would nest one level deeper per copy
+    corpus = re.sub(r"<base[^>]*>", "", corpus)
+    html = corpus * (BENCH_SIZE // len(corpus) + 1)
+    print(f"\nThroughput on {len(html) / (1024 * 1024):.1f} MB of fixture HTML (best of 3):")
+    throughput("regex (previous)", regex_rewrite, html)
+    throughput("tokenizer, whole document", lambda h: new_rewriter().rewrite(h), html)
+    throughput(f"tokenizer, {CHUNK_SIZE // 1024} KB chunks", lambda h: rewrite_chunked(h, CHUNK_SIZE), html)
+
+
+if __name__ == "__main__":
+    update = "--update" in sys.argv
+    print("Fixtures:")
+    passed = check_fixtures(update)
+    if not update:
+        benchmark()
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,249 @@
+"""
+Query-plan regression check: no hot query may scan a whole table.
+
+Usage (from edu-resource-site/):
+    uv run python scripts/check_query_plans.py             # default data size
+    uv run python scripts/check_query_plans.py --scale 5   # 5x more rows
+
+Seeds a throwaway SQLite database with a large site (tens of thousands
+of assignments, hundreds of thousands of comments), then calls the
+public and admin routes that run on every page view through the app,
+plus the background workers' polling queries. Every SELECT, UPDATE and
+DELETE they issue is captured and run through EXPLAIN QUERY PLAN; a
+plain "SCAN <table>" step (a full table scan, as opposed to a SEARCH or
+a walk along an index) fails the check, as does sorting the matching
+rows in a temp B-tree instead of reading them in index order. The
+planner runs without ANALYZE statistics, as on a deployed database.
+
+Reports that aggregate over a whole table by design (e.g.
+/api/admin/storage) and free-text search (LIKE '%...%') are not checked.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/plans.db"
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ["STORAGE_ROOT"] = f"{_tmp.name}/storage"  # the garbage collector deletes files
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+from backend.auth import create_access_token  # noqa: E402
+from backend.database import create_db_and_tables, engine  # noqa: E402
+from backend.main import app  # noqa: E402
+from backend.models import (  # noqa: E402
+    Assignment, Blob, BlogPost, Comment, ImportJob, InstructionPage, SupplementaryMaterial, UploadSession, User,
+)
+from backend.services import (  # noqa: E402
+    file_service, garbage_collector, import_jobs, material_service, storage, upload_sessions,
+)
+
+ROWS = {
+    "users": 1_000,
+    "assignments": 20_000,
+    "comments": 200_000,
+    "materials": 40_000,
+    "blog_posts": 5_000,
+    "instruction_pages": 2_000,
+    "import_jobs": 20_000,
+    "upload_sessions": 2_000,
+}
+CATEGORIES = ["general", "getting-started", "github", "teaching", "faq"]
+SUBJECTS = ["math", "physics", "biology", "history", "computing"]
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+SORT = "USE TEMP B-TREE FOR ORDER BY"  # sorts every matching row, however small the page
+
+
+def seed(scale: float) -> dict:
+    n = {name: int(count * scale) for name, count in ROWS.items()}
+    rng = random.Random(1)
+    now = datetime.utcnow()
+
+    def when(i: int) -> datetime:
+        return now - timedelta(minutes=i)
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "email": f"user{i}@plans.test", "display_name": f"User {i}", "hashed_password": "x",
+             "role": "admin" if i == 1 else "user", "is_active": True, "verification_status": "unverified",
+             "created_at": now, "updated_at": now}
+            for i in range(1, n["users"] + 1)
+        ])
+        conn.execute(insert(Assignment), [
+            {"id": i, "title": f"Assignment {i}", "description": "Seeded", "subject_area": rng.choice(SUBJECTS),
+             "tags": [], "file_path": "index.html", "is_published": i % 10 != 0,
+             "deleted_at": now if i % 100 == 0 else None, "created_by_id": rng.randint(1, n["users"]),
+             "created_at": when(i), "updated_at": when(i)}
+            for i in range(1, n["assignments"] + 1)
+        ])
+        conn.execute(insert(Comment), [
+            {"id": i, "assignment_id": rng.randint(1, n["assignments"]), "user_id": rng.randint(1, n["users"]),
+             "content": "Seeded comment", "parent_id": None, "deleted_at": now if i % 500 == 0 else None,
+             "created_at": when(i), "updated_at": when(i)}
+            for i in range(1, n["comments"] + 1)
+        ])
+        conn.execute(insert(SupplementaryMaterial), [
+            {"id": i, "assignment_id": rng.randint(1, n["assignments"]), "material_type": "article",
+             "title": f"Material {i}", "url": "https://example.org", "display_order": i % 7,
+             "deleted_at": now if i % 500 == 0 else None, "created_at": when(i)}
+            for i in range(1, n["materials"] + 1)
+        ])
+        conn.execute(insert(BlogPost), [
+            {"id": i, "title": f"Post {i}", "slug": f"post-{i}", "content": "Seeded", "tags": [],
+             "is_published": i % 4 != 0, "author_id": rng.randint(1, n["users"]),
+             "published_at": when(i), "created_at": when(i), "updated_at": when(i)}
+            for i in range(1, n["blog_posts"] + 1)
+        ])
+        conn.execute(insert(InstructionPage), [
+            {"id": i, "title": f"Page {i}", "slug": f"page-{i}", "content": "Seeded",
+             "category": CATEGORIES[i % len(CATEGORIES)], "display_order": i, "is_published": i % 4 != 0,
+             "author_id": rng.randint(1, n["users"]), "created_at": now, "updated_at": now}
+            for i in range(1, n["instruction_pages"] + 1)
+        ])
+        conn.execute(insert(ImportJob), [
+            {"id": i, "kind": "sync", "status": "done", "assignment_id": rng.randint(1, n["assignments"]),
+             "attempts": 1, "next_attempt_at": when(i), "files_done": 0, "files_total": 0, "bytes_done": 0,
+             "created_at": when(i), "updated_at": when(i)}
+            for i in range(1, n["import_jobs"] + 1)
+        ])
+        conn.execute(insert(UploadSession), [
+            {"id": f"{i:032x}", "assignment_id": rng.randint(1, n["assignments"]), "filename": "f.pdf",
+             "size": 1000, "received": 0, "title": "Upload", "material_type": "document",
+             "created_at": now, "expires_at": now + timedelta(hours=1)}
+            for i in range(1, n["upload_sessions"] + 1)
+        ])
+    return n
+
+
+def seed_files(n: dict, aid: int) -> int:
+    """
+    Store a page for assignment `aid` and upload it as a material too (so
+    the file and download routes find real objects), alongside a few link
+    materials. Returns the uploaded material's id.
+    """
+    content = b"<!doctype html><title>Seeded</title><p>Seeded page</p>"
+    hasher = file_service.blob_hasher(len(content))
+    hasher.update(content)
+    sha = hasher.hexdigest()
+    storage.backend.put_bytes(file_service.blob_key(sha), content)
+    file_service.write_manifest(aid, {"index.html": sha})
+
+    now = datetime.utcnow()
+    first = n["materials"] + 1
+    with engine.begin() as conn:
+        conn.execute(insert(Blob), [{"sha": sha, "size": len(content), "ref_count": 2, "created_at": now}])
+        conn.execute(insert(SupplementaryMaterial), [
+            {"id": first, "assignment_id": aid, "material_type": "document", "title": "Handout",
+             "file_path": material_service.blob_file_path(sha), "original_filename": "handout.html",
+             "file_size": len(content), "content_hash": sha, "display_order": 0, "created_at": now},
+        ])
+        conn.execute(insert(SupplementaryMaterial), [
+            {"id": first + i, "assignment_id": aid, "material_type": "article", "title": f"Link {i}",
+             "url": "https://example.org", "display_order": i, "created_at": now}
+            for i in range(1, 4)
+        ])
+    return first
+
+
+def capture():
+    """Start recording the statements sent to the database; returns the list they go into."""
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            statements.append((statement, parameters))
+
+    return statements
+
+
+def full_scans(statement: str, parameters) -> list[str]:
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        steps = [row[3] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+    return [step for step in steps if FULL_SCAN.match(step) or step == SORT]
+
+
+def check(label: str, run, statements: list) -> bool:
+    statements.clear()
+    run()
+    problems = []
+    for statement, parameters in statements:
+        for step in full_scans(statement, parameters):
+            problems.append(f"{step}: {' '.join(statement.split())[:160]}")
+    print(f"  {'FAIL' if problems else 'ok'}: {label} ({len(statements)} queries)"
+          + "".join(f"\n    - {p}" for p in problems))
+    return not problems
+
+
+def _get(client: TestClient, url: str) -> None:
+    response = client.get(url, follow_redirects=False)
+    if response.status_code >= 400:
+        raise RuntimeError(f"GET {url}: {response.status_code} {response.text[:200]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the seeded row counts")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    n = seed(args.scale)
+    print("Seeded " + ", ".join(f"{count} {name}" for name, count in n.items()))
+
+    client = TestClient(app)  # no lifespan: the background workers are called directly below
+    client.headers["Authorization"] = f"Bearer {create_access_token({'sub': '1'})}"
+    aid = n["assignments"] // 2 + 1
+    mid = seed_files(n, aid)
+    statements = capture()
+    routes = [
+        "/api/assignments/",
+        "/api/assignments/?subject_area=math",
+        "/api/assignments/?published_only=false",
+        "/api/assignments/?skip=500&limit=50",
+        f"/api/assignments/{aid}",
+        f"/api/assignments/{aid}/comments/",
+        f"/api/assignments/{aid}/serve",
+        f"/api/assignments/{aid}/files/index.html",
+        f"/api/assignments/{aid}/materials/",
+        f"/api/assignments/{aid}/materials/{mid}/download",
+        f"/api/assignments/{aid}/export",
+        "/api/blog/",
+        "/api/blog/?skip=100",
+        "/api/blog/post-7",
+        "/api/instructions/",
+        "/api/instructions/?category=github",
+        "/api/instructions/page-3",
+        "/api/auth/me",
+        "/api/admin/gc",
+    ]
+    print("Routes:")
+    passed = True
+    for url in routes:
+        passed &= check(f"GET {url}", lambda: _get(client, url), statements)
+
+    print("Background workers:")
+    passed &= check("import_jobs claim", import_jobs._claim_next, statements)
+    passed &= check("upload_sessions.sweep", upload_sessions.sweep, statements)
+    passed &= check("garbage_collector.collect, one batch", lambda: garbage_collector.collect(batch_size=20), statements)
+    # A batch large enough to empty the deleted assignments, so they are purged too
+    passed &= check("garbage_collector.collect, to the end", lambda: garbage_collector.collect(batch_size=10_000), statements)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()